@@ -0,0 +1,113 @@
+"""Friend graph queries: per-call $or scans vs the cached adjacency sets.
+
+Run from backend/ against a local mongod (uses a scratch database):
+
+    BENCH_DB_NAME=nstrack_bench python -m benchmarks.friend_graph --users 10000 --friends 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+os.environ['DB_NAME'] = os.environ.get('BENCH_DB_NAME', 'nstrack_bench')
+
+from server import FriendGraph, client, db, ensure_indexes  # noqa: E402
+
+async def seed(users: int, friends: int) -> list:
+    await db.friendships.drop()
+    await ensure_indexes()
+
+    # Ring lattice: everyone is friends with the friends/2 users on either side,
+    # which gives every user exactly `friends` friends and plenty of mutuals
+    ids = [str(uuid.uuid4()) for _ in range(users)]
+    now = datetime.now(timezone.utc)
+    edges = []
+    for i, user_id in enumerate(ids):
+        for offset in range(1, friends // 2 + 1):
+            edges.append({"id": str(uuid.uuid4()), "user1_id": user_id,
+                          "user2_id": ids[(i + offset) % users], "created_at": now})
+        if len(edges) >= 10000:
+            await db.friendships.insert_many(edges, ordered=False)
+            edges = []
+    if edges:
+        await db.friendships.insert_many(edges, ordered=False)
+    return ids
+
+async def scan_friend_ids(user_id: str) -> set:
+    # The $or lookup every friends endpoint used before the adjacency cache
+    edges = await db.friendships.find({
+        "$or": [{"user1_id": user_id}, {"user2_id": user_id}]
+    }, {"_id": 0, "user1_id": 1, "user2_id": 1}).to_list(None)
+    return {edge['user2_id'] if edge['user1_id'] == user_id else edge['user1_id'] for edge in edges}
+
+async def scan_is_friend(a: str, b: str) -> bool:
+    edge = await db.friendships.find_one({
+        "$or": [{"user1_id": a, "user2_id": b}, {"user1_id": b, "user2_id": a}]
+    })
+    return edge is not None
+
+async def scan_mutual(a: str, b: str) -> set:
+    return await scan_friend_ids(a) & await scan_friend_ids(b)
+
+async def scan_suggestions(user_id: str) -> list:
+    friends = await scan_friend_ids(user_id)
+    counts = Counter()
+    for friend_id in friends:
+        counts.update(await scan_friend_ids(friend_id))
+    for excluded in friends | {user_id}:
+        counts.pop(excluded, None)
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+async def timed(label: str, fn, pairs: list) -> float:
+    start = time.perf_counter()
+    for args in pairs:
+        await fn(*args)
+    per_call = (time.perf_counter() - start) * 1000 / len(pairs)
+    print(f"{label:28} {per_call:9.3f} ms/call")
+    return per_call
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--friends", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"seeding {args.users} users x {args.friends} friends")
+    ids = await seed(args.users, args.friends)
+    rng = random.Random(args.seed)
+    pairs = [(rng.choice(ids), rng.choice(ids)) for _ in range(args.samples)]
+    singles = [(a,) for a, _ in pairs[:max(1, args.samples // 10)]]
+
+    graph = FriendGraph(maxsize=args.users * 2, ttl=3600)
+    # Sanity check: both implementations agree before anything is timed
+    for a, b in pairs[:20]:
+        assert await scan_mutual(a, b) == await graph.mutual(a, b)
+    for (a,) in singles[:5]:
+        assert await scan_suggestions(a) == await graph.suggestions(a)
+
+    results = {}
+    for name, scan, cached, workload in (
+        ("is-friend", scan_is_friend, graph.are_friends, pairs),
+        ("mutual friends", scan_mutual, graph.mutual, pairs),
+        ("suggestions", scan_suggestions, graph.suggestions, singles),
+    ):
+        graph.invalidate(*ids)
+        before = await timed(f"{name} ($or scan)", scan, workload)
+        cold = await timed(f"{name} (graph, cold)", cached, workload)
+        warm = await timed(f"{name} (graph, warm)", cached, workload)
+        results[name] = (before, cold, warm)
+
+    print()
+    for name, (before, cold, warm) in results.items():
+        print(f"{name:16} cold {before / cold:6.1f}x   warm {before / warm:8.1f}x")
+    print(f"cache: {graph.snapshot()}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    client.close()
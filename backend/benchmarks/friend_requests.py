@@ -0,0 +1,83 @@
+"""Pending friend request listing: per-row user lookups vs one batched fetch.
+
+Run from backend/ against a local mongod (uses a scratch database):
+
+    BENCH_DB_NAME=nstrack_bench python -m benchmarks.friend_requests --pending 500
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+os.environ['DB_NAME'] = os.environ.get('BENCH_DB_NAME', 'nstrack_bench')
+
+from server import MAX_PAGE_SIZE, client, db, ensure_indexes, list_pending_requests  # noqa: E402
+
+async def seed(pending: int) -> str:
+    await db.users.drop()
+    await db.friend_requests.drop()
+    await ensure_indexes()
+
+    receiver_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    users = [{"id": receiver_id, "name": "Receiver", "email": "receiver@bench.local",
+              "batch": "Turing", "skill_level": "Beginner"}]
+    requests = []
+    for i in range(pending):
+        sender_id = str(uuid.uuid4())
+        users.append({"id": sender_id, "name": f"Sender {i}", "email": f"sender{i}@bench.local",
+                      "batch": "Hopper", "skill_level": "Intermediate", "password_hash": "x" * 60})
+        requests.append({"id": str(uuid.uuid4()), "sender_id": sender_id, "receiver_id": receiver_id,
+                         "status": "pending", "created_at": now - timedelta(seconds=i)})
+    await db.users.insert_many(users)
+    await db.friend_requests.insert_many(requests)
+    return receiver_id
+
+async def n_plus_one(receiver_id: str):
+    # The listing as it was before batching: one users round trip per request row
+    requests = await db.friend_requests.find(
+        {"receiver_id": receiver_id, "status": "pending"}, {"_id": 0}
+    ).to_list(1000)
+    for request in requests:
+        sender = await db.users.find_one({"id": request['sender_id']}, {"_id": 0, "password_hash": 0})
+        if sender:
+            request['sender'] = {"id": sender['id'], "name": sender['name'],
+                                 "batch": sender.get('batch'), "skill_level": sender.get('skill_level')}
+    return requests
+
+async def batched(receiver_id: str):
+    # Walk every page so both variants return the same rows
+    cursor = None
+    while True:
+        page = await list_pending_requests("receiver_id", "sender_id", "sender", receiver_id,
+                                           {"cursor": cursor, "limit": MAX_PAGE_SIZE})
+        cursor = page['next_cursor']
+        if cursor is None:
+            return
+
+async def timed(fn, receiver_id: str, rounds: int) -> float:
+    await fn(receiver_id)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await fn(receiver_id)
+    return (time.perf_counter() - start) * 1000 / rounds
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pending", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    receiver_id = await seed(args.pending)
+    before = await timed(n_plus_one, receiver_id, args.rounds)
+    after = await timed(batched, receiver_id, args.rounds)
+
+    print(f"pending requests: {args.pending}")
+    print(f"n+1 lookups:      {before:8.2f} ms/call")
+    print(f"batched + paged:  {after:8.2f} ms/call ({before / after:.1f}x)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    client.close()
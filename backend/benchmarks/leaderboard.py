@@ -0,0 +1,92 @@
+"""Points leaderboard: sorting/counting in Mongo per request vs the indexed, incremental ranks.
+
+Run from backend/ against a local mongod (uses a scratch database):
+
+    BENCH_DB_NAME=nstrack_bench python -m benchmarks.leaderboard --users 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+os.environ['DB_NAME'] = os.environ.get('BENCH_DB_NAME', 'nstrack_bench')
+
+from server import (  # noqa: E402
+    LEADERBOARD_PROJECTION, LEADERBOARD_SORT, Leaderboard, client, db, ensure_indexes,
+)
+
+BATCHES = ["Turing", "Hopper", "Neumann", "Ramanujan"]
+
+async def seed(users: int, rng: random.Random) -> list:
+    await db.users.drop()
+    await ensure_indexes()
+
+    docs = []
+    for i in range(users):
+        docs.append({"id": str(uuid.uuid4()), "name": f"User {i}", "email": f"user{i}@bench.local",
+                     "batch": rng.choice(BATCHES), "skill_level": "Beginner",
+                     "points": int(rng.paretovariate(1.5) * 10)})
+        if len(docs) >= 10000:
+            await db.users.insert_many(docs, ordered=False)
+            docs = []
+    if docs:
+        await db.users.insert_many(docs, ordered=False)
+    return [(user['id'], user['batch'], user['points'])
+            async for user in db.users.find({}, {"_id": 0, "id": 1, "batch": 1, "points": 1})]
+
+async def unindexed_top(batch: str, limit: int) -> list:
+    # What ranking looked like with only get_users: load everyone, sort in Python
+    users = await db.users.find({"batch": batch}, {"_id": 0, "password_hash": 0}).to_list(None)
+    return sorted(users, key=lambda user: (-user.get('points', 0), user['id']))[:limit]
+
+async def indexed_top(batch: str, limit: int) -> list:
+    return await db.users.find({"batch": batch}, LEADERBOARD_PROJECTION).sort(LEADERBOARD_SORT).limit(limit).to_list(limit)
+
+async def counted_rank(user_id: str, batch: str, points: int) -> int:
+    # Rank straight from the index: counts every higher key, so O(rank)
+    return await db.users.count_documents({"batch": batch, "points": {"$gt": points}}) + 1
+
+async def timed(label: str, fn, calls: list) -> float:
+    start = time.perf_counter()
+    for args in calls:
+        result = fn(*args)
+        if asyncio.iscoroutine(result):
+            await result
+    per_call = (time.perf_counter() - start) * 1000 / len(calls)
+    print(f"{label:34} {per_call:10.4f} ms/call")
+    return per_call
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"seeding {args.users} users")
+    members = await seed(args.users, rng)
+
+    board = Leaderboard()
+    await board.rebuild()
+    print(f"rebuild: {board.last_rebuild_ms:.1f} ms for {len(board.members)} users")
+
+    sample = [rng.choice(members) for _ in range(args.samples)]
+    for user_id, batch, points in sample[:20]:
+        assert board.rank(user_id, batch)['rank'] == await counted_rank(user_id, batch, points)
+
+    tops = [(rng.choice(BATCHES), args.top) for _ in range(max(1, args.samples // 20))]
+    await timed("top-N (load + sort)", unindexed_top, tops)
+    await timed("top-N (batch_points_id index)", indexed_top, tops)
+    await timed("my rank (count_documents)", counted_rank, sample)
+    await timed("my rank (bisect)", lambda user_id, batch, _: board.rank(user_id, batch), sample)
+    updates = [(user_id, batch, points + rng.randrange(1, 50)) for user_id, batch, points in sample]
+    await timed("points update (incremental)", board.update, updates)
+    print(f"leaderboard: {board.snapshot()}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    client.close()
@@ -0,0 +1,301 @@
+"""Load test: scripted user scenarios against the real app, with per-route latency and throughput.
+
+Seeds a synthetic dataset into a scratch database, then runs each scenario with
+concurrent async clients. By default requests go in-process through the ASGI
+app; pass --base-url to drive a running server instead (it must point at the
+same database). Run from backend/ against a local mongod:
+
+    BENCH_DB_NAME=nstrack_bench python -m benchmarks.load --users 5000 --clients 50
+    BENCH_DB_NAME=nstrack_bench python -m benchmarks.load --skip-seed --compare load-<commit>.json
+
+Results (config, git commit and p50/p95/p99/RPS per route and scenario) are
+written as JSON so runs can be compared across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+os.environ['DB_NAME'] = os.environ.get('BENCH_DB_NAME', 'nstrack_bench')
+
+import httpx  # noqa: E402
+
+from server import (  # noqa: E402
+    LatencyStats, Notification, User, app, client, create_user_token, db, ensure_indexes,
+    hash_password, leaderboard, name_search_fields, normalize_email,
+)
+
+BATCHES = ["Turing", "Hopper", "Neumann", "Ramanujan"]
+FIRST_NAMES = ["Ada", "Alan", "Grace", "John", "Srinivasa", "Katherine", "Edsger", "Barbara",
+               "Donald", "Margaret", "Dennis", "Frances", "Ken", "Radia", "Tim", "Shafi"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Neumann", "Ramanujan", "Johnson", "Dijkstra",
+              "Liskov", "Knuth", "Hamilton", "Ritchie", "Allen", "Thompson", "Perlman", "Lee"]
+PASSWORD = "bench-password"
+SEEDED = ("users", "friendships", "friend_requests", "notifications", "notification_counters",
+          "problem_completions", "problem_progress")
+
+
+# Dataset
+async def seed(users: int, friends: int, notifications: int, rng: random.Random) -> list:
+    for name in SEEDED:
+        await db[name].drop()
+    await ensure_indexes()
+
+    # One bcrypt hash shared by every account keeps seeding fast; logins still verify it
+    password_hash = hash_password(PASSWORD)
+    now = datetime.now(timezone.utc)
+    seeded = []
+    docs = []
+    for i in range(users):
+        user = User(
+            name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}",
+            email=f"user{i}@bench.local",
+            skill_level=rng.choice(["Beginner", "Intermediate", "Advanced"]),
+            batch=BATCHES[i % len(BATCHES)],
+            points=int(rng.paretovariate(1.5) * 10),
+            created_at=now - timedelta(minutes=i),
+        )
+        doc = user.model_dump()
+        doc.update(name_search_fields(user.name))
+        doc['email_lower'] = normalize_email(user.email)
+        doc['password_hash'] = password_hash
+        docs.append(doc)
+        seeded.append({"id": user.id, "name": user.name, "email": user.email})
+        if len(docs) >= 5000:
+            await db.users.insert_many(docs, ordered=False)
+            docs = []
+    if docs:
+        await db.users.insert_many(docs, ordered=False)
+
+    # Random graph with an average degree of `friends`
+    ids = [user['id'] for user in seeded]
+    edges = set()
+    for i, user_id in enumerate(ids):
+        for other in rng.sample(range(users), min(users - 1, friends // 2)):
+            if other != i:
+                edges.add((user_id, ids[other]) if user_id < ids[other] else (ids[other], user_id))
+    await insert_batched("friendships", [
+        {"id": f"{a}:{b}", "user1_id": a, "user2_id": b, "created_at": now} for a, b in edges
+    ])
+
+    seeded_notifications = [
+        Notification(
+            user_id=user_id, type="friend_accepted", title="Friend Request Accepted",
+            message=f"Notification {n}", link="/friends", read=rng.random() < 0.7,
+            created_at=now - timedelta(seconds=n * 37),
+        ).model_dump()
+        for user_id in ids for n in range(notifications)
+    ]
+    await insert_batched("notifications", seeded_notifications)
+    unread = Counter(doc['user_id'] for doc in seeded_notifications if not doc['read'])
+    await insert_batched("notification_counters", [
+        {"user_id": user_id, "unread": unread[user_id]} for user_id in ids
+    ])
+
+    print(f"seeded {users} users, {len(edges)} friendships, {users * notifications} notifications")
+    return seeded
+
+async def insert_batched(collection: str, docs: list, batch_size: int = 10000):
+    for start in range(0, len(docs), batch_size):
+        await db[collection].insert_many(docs[start:start + batch_size], ordered=False)
+
+async def load_seeded() -> list:
+    return await db.users.find({}, {"_id": 0, "id": 1, "name": 1, "email": 1}).to_list(None)
+
+
+# Measurement
+class Recorder:
+    """Latency samples and status codes per route template"""
+
+    def __init__(self):
+        self.latency = defaultdict(lambda: LatencyStats(window=10_000_000))
+        self.statuses = defaultdict(Counter)
+
+    def record(self, route: str, ms: float, status: int):
+        self.latency[route].record(ms)
+        self.statuses[route][status] += 1
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            route: {
+                **stats.snapshot(),
+                "rps": round(stats.count / elapsed, 1) if elapsed else 0.0,
+                "statuses": {str(code): n for code, n in sorted(self.statuses[route].items())},
+            }
+            for route, stats in sorted(self.latency.items())
+        }
+
+class Session:
+    """One virtual user: an HTTP client that times every call under its route template"""
+
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, user: dict = None):
+        self.http = http
+        self.recorder = recorder
+        self.headers = {}
+        if user is not None:
+            self.headers["Authorization"] = f"Bearer {create_user_token(user['id'], user['name'])}"
+
+    async def call(self, method: str, route: str, json_body=None, params=None, **path) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.http.request(method, route.format(**path), json=json_body,
+                                           params=params, headers=self.headers)
+        self.recorder.record(f"{method} {route}", (time.perf_counter() - start) * 1000, response.status_code)
+        return response
+
+
+# Scenarios: each coroutine is one virtual user's script
+async def login_storm(session: Session, user: dict, rng: random.Random, iterations: int):
+    for _ in range(iterations):
+        await session.call("POST", "/api/auth/login", {"email": user['email'].upper(), "password": PASSWORD})
+
+async def dashboard(session: Session, user: dict, rng: random.Random, iterations: int):
+    for _ in range(iterations):
+        await session.call("GET", "/api/auth/profile")
+        await session.call("GET", "/api/notifications/unread/count")
+        await session.call("GET", "/api/friends/list", params={"limit": 50})
+        await session.call("GET", "/api/friends/requests/incoming")
+        await session.call("GET", "/api/leaderboard", params={"limit": 10})
+        await session.call("GET", "/api/leaderboard/me")
+        await session.call("GET", "/api/progress/{user_id}", user_id=user['id'])
+        await session.call("GET", "/api/friends/suggestions", params={"limit": 10})
+
+async def friend_flow(session: Session, user: dict, rng: random.Random, iterations: int, users: list,
+                      sessions: dict):
+    for _ in range(iterations):
+        other = rng.choice(users)
+        roster = rng.sample(users, min(len(users), 20))
+        await session.call("POST", "/api/friends/status",
+                           {"user_ids": [member['id'] for member in roster]})
+        sent = await session.call("POST", "/api/friends/request/{user_id}", user_id=other['id'])
+        if sent.status_code != 200:
+            continue  # already friends or pending: still a timed request
+        receiver = sessions[other['id']]
+        incoming = await receiver.call("GET", "/api/friends/requests/incoming")
+        request_id = sent.json()['request_id']
+        if any(request['id'] == request_id for request in incoming.json().get('requests', [])):
+            await receiver.call("POST", "/api/friends/accept/{request_id}", request_id=request_id)
+        await session.call("GET", "/api/friends/status/{user_id}", user_id=other['id'])
+        await receiver.call("GET", "/api/notifications", params={"limit": 20})
+
+async def search_typing(session: Session, user: dict, rng: random.Random, iterations: int, users: list):
+    for _ in range(iterations):
+        name = rng.choice(users)['name']
+        # One request per keystroke, like an undebounced search box
+        for end in range(1, min(len(name), 12) + 1):
+            await session.call("GET", "/api/search/users", params={"q": name[:end], "limit": 10})
+
+async def notification_polling(session: Session, user: dict, rng: random.Random, iterations: int):
+    for _ in range(iterations):
+        await session.call("GET", "/api/notifications/unread/count")
+        await session.call("GET", "/api/notifications", params={"limit": 20})
+        await asyncio.sleep(rng.uniform(0, 0.05))
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "dashboard": dashboard,
+    "friend_flow": friend_flow,
+    "search_typing": search_typing,
+    "notification_polling": notification_polling,
+}
+
+async def run_scenario(name: str, http: httpx.AsyncClient, users: list, clients: int, iterations: int,
+                       rng: random.Random) -> dict:
+    recorder = Recorder()
+    actors = rng.sample(users, min(clients, len(users)))
+    sessions = {user['id']: Session(http, recorder, user) for user in users} if name == "friend_flow" else {}
+    scripts = []
+    for user in actors:
+        session = sessions.get(user['id']) or Session(http, recorder, None if name == "login_storm" else user)
+        extra = {}
+        if name == "friend_flow":
+            extra = {"users": users, "sessions": sessions}
+        elif name == "search_typing":
+            extra = {"users": users}
+        scripts.append(SCENARIOS[name](session, user, random.Random(rng.random()), iterations, **extra))
+
+    start = time.perf_counter()
+    await asyncio.gather(*scripts)
+    elapsed = time.perf_counter() - start
+    routes = recorder.report(elapsed)
+    total = sum(route['count'] for route in routes.values())
+    return {"clients": len(actors), "elapsed_s": round(elapsed, 3),
+            "requests": total, "rps": round(total / elapsed, 1), "routes": routes}
+
+
+# Reporting
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_report(results: dict, baseline: dict = None):
+    for name, scenario in results['scenarios'].items():
+        print(f"\n{name}: {scenario['requests']} requests from {scenario['clients']} clients "
+              f"in {scenario['elapsed_s']}s ({scenario['rps']} req/s)")
+        previous = (baseline or {}).get('scenarios', {}).get(name, {}).get('routes', {})
+        for route, stats in scenario['routes'].items():
+            line = (f"  {route:42} p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  "
+                    f"p99 {stats['p99_ms']:8.2f} ms  {stats['rps']:8.1f} req/s  {stats['statuses']}")
+            if route in previous and previous[route]['p95_ms']:
+                line += f"  p95 {stats['p95_ms'] / previous[route]['p95_ms']:.2f}x vs baseline"
+            print(line)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--friends", type=int, default=20, help="average friends per user")
+    parser.add_argument("--notifications", type=int, default=30, help="notifications per user")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent virtual users per scenario")
+    parser.add_argument("--iterations", type=int, default=10, help="script repetitions per virtual user")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--base-url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the dataset from a previous run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file (default: load-<commit>.json)")
+    parser.add_argument("--compare", help="previous results file to compare p95 against")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    users = await load_seeded() if args.skip_seed else await seed(args.users, args.friends, args.notifications, rng)
+    if not users:
+        raise SystemExit("No users seeded; run without --skip-seed first")
+
+    if args.base_url:
+        transport, base_url = None, args.base_url
+    else:
+        # ASGI transport skips startup hooks; do the ones the routes depend on
+        await ensure_indexes()
+        await leaderboard.rebuild()
+        transport, base_url = httpx.ASGITransport(app=app), "http://bench"
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {},
+    }
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=60) as http:
+        for name in args.scenarios:
+            print(f"running {name}...")
+            results['scenarios'][name] = await run_scenario(name, http, users, args.clients, args.iterations, rng)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, baseline)
+
+    output = Path(args.output or f"load-{commit}.json")
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nresults written to {output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    client.close()
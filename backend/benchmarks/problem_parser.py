@@ -0,0 +1,108 @@
+"""Problem parser: legacy split-and-rescan vs the incremental ProblemParser.
+
+Correctness (fields, diagnostics, chunking invariance) is covered by
+tests/test_problem_parser.py, which also uses make_response() from here;
+this only times the two parsers. Both sides build Problem models, as the
+endpoints do.
+
+    python -m benchmarks.problem_parser --problems 1000
+"""
+import argparse
+import random
+import time
+
+from server import Problem, ProblemParser
+
+def legacy_parse(response: str, track: str = "bench", difficulty: str = "easy"):
+    # The parser as it was before ProblemParser, kept here as the baseline
+    problems = []
+    for block in response.split('---'):
+        if 'TITLE:' in block:
+            fields = {"title": "", "description": "", "hints": [], "solution": ""}
+            for line in block.strip().split('\n'):
+                if line.startswith('TITLE:'):
+                    fields['title'] = line.replace('TITLE:', '').strip()
+                elif line.startswith('DESCRIPTION:'):
+                    fields['description'] = line.replace('DESCRIPTION:', '').strip()
+                elif line.startswith('HINTS:'):
+                    fields['hints'] = [h.strip() for h in line.replace('HINTS:', '').strip().split('|')]
+                elif line.startswith('SOLUTION:'):
+                    fields['solution'] = line.replace('SOLUTION:', '').strip()
+            if fields['title']:
+                problems.append(Problem(
+                    track=track, difficulty=difficulty, title=fields['title'],
+                    description=fields['description'], hints=fields['hints'],
+                    solution_approach=fields['solution']
+                ))
+    return problems
+
+WORDS = "array string graph tree node edge sum window pointer heap stack queue".split()
+# Malformed lines the tests scatter through responses
+NOISE = ["", "---", "stray text", "TITLE:", "HINTS: a|b", "**DESCRIPTION:** extra"]
+
+def sentence(rng: random.Random) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+
+def make_response(rng: random.Random, count: int, noise: int = 0) -> str:
+    """A model-style response of `count` problems, with `noise` malformed lines inserted"""
+    blocks = []
+    for i in range(count):
+        description = '\n'.join(sentence(rng) for _ in range(rng.randint(1, 4)))
+        if rng.random() < 0.3:
+            hints = '\n' + '\n'.join(f"- {sentence(rng)}" for _ in range(rng.randint(2, 3)))
+        else:
+            hints = ' | '.join(sentence(rng) for _ in range(rng.randint(2, 3)))
+        key = rng.choice(["TITLE:", "**TITLE:**"])
+        blocks.append(
+            f"---\n{key} Problem {i}\nDESCRIPTION: {description}\nHINTS: {hints}\n"
+            f"SOLUTION: {sentence(rng)}\n{sentence(rng)}\n---"
+        )
+    lines = ("Here are your problems:\n" + '\n'.join(blocks) + "\n").split('\n')
+    for _ in range(noise):
+        lines.insert(rng.randint(0, len(lines)), rng.choice(NOISE))
+    return '\n'.join(lines)
+
+def parse(text: str, chunks=None):
+    parser = ProblemParser("bench", "easy")
+    problems = []
+    for chunk in chunks if chunks is not None else [text]:
+        problems += parser.feed(chunk)
+    problems += parser.close()
+    return problems
+
+def timed(fn, rounds: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) * 1000 / rounds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--problems", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    text = make_response(rng, args.problems)
+    chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+
+    legacy = legacy_parse(text)
+    current = parse(text)
+    by_title = {problem.title: problem for problem in current}
+    lost = sum(1 for old in legacy if old.description != by_title[old.title].description)
+    print(f"response: {len(text) / 1024:.0f} KiB, {args.problems} problems")
+    print(f"legacy parsed {len(legacy)} problems, truncated {lost} multi-line descriptions")
+    print(f"incremental parsed {len(current)} problems")
+    # Legacy drops every **TITLE:** block, so compare per parsed problem as well
+    for label, fn, parsed in (
+        ("legacy, whole text", lambda: legacy_parse(text), len(legacy)),
+        ("incremental, whole text", lambda: parse(text), len(current)),
+        ("incremental, 8-char feeds", lambda: parse(text, chunks), len(current)),
+    ):
+        total = timed(fn, args.rounds)
+        print(f"{label + ':':27}{total:8.2f} ms  {total * 1000 / max(parsed, 1):7.1f} us/problem")
+
+if __name__ == "__main__":
+    main()
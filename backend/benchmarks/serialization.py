@@ -0,0 +1,87 @@
+"""Response serialization: FastAPI's default encoder path vs projected documents through orjson.
+
+Pure CPU, no database needed. Run from backend/:
+
+    python -m benchmarks.serialization --users 1000
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server import ModelJSONResponse, User, json_response, user_response
+
+BATCHES = ["Turing", "Hopper", "Neumann", "Ramanujan"]
+
+def user_docs(count: int) -> list:
+    # Shaped like get_users rows: PUBLIC_USER_PROJECTION over native-date documents
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "name": f"User {i}",
+        "email": f"user{i}@bench.local",
+        "skill_level": "Intermediate",
+        "batch": BATCHES[i % len(BATCHES)],
+        "gender": None,
+        "points": i * 7 % 500,
+        "selected_track": "Python",
+        "following": [],
+        "followers": [],
+        "created_at": now - timedelta(minutes=i),
+    } for i in range(count)]
+
+def legacy_users(docs: list) -> bytes:
+    # Before: ISO-string dates re-parsed per row, then jsonable_encoder + json.dumps
+    users = [{**doc, "created_at": doc['created_at'].isoformat()} for doc in docs]
+    for user in users:
+        if isinstance(user.get('created_at'), str):
+            user['created_at'] = datetime.fromisoformat(user['created_at'])
+    return JSONResponse(jsonable_encoder({"users": users, "next_cursor": None})).body
+
+def fast_users(docs: list) -> bytes:
+    return json_response({"users": docs, "next_cursor": None}).body
+
+def legacy_profile(doc: dict) -> bytes:
+    # Before: dict -> User model -> response_model validation -> encoder -> json.dumps
+    user = User(**doc)
+    return JSONResponse(jsonable_encoder(User.model_validate(user.model_dump()))).body
+
+def fast_profile(doc: dict) -> bytes:
+    return json_response(user_response(doc), response_class=ModelJSONResponse).body
+
+def cpu_per_call(fn, arg, rounds: int) -> float:
+    fn(arg)
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.process_time() - start) * 1000 / rounds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    docs = user_docs(args.users)
+    # Same fields, same values: only the serialization path differs
+    assert json.loads(fast_users(docs)) == json.loads(legacy_users(docs))
+    assert json.loads(fast_profile(docs[0])) == json.loads(legacy_profile(docs[0]))
+    # Older documents lack fields the model defaults
+    sparse = {key: value for key, value in docs[0].items() if key not in ("points", "following", "followers")}
+    assert json.loads(fast_profile(sparse)) == json.loads(legacy_profile(sparse))
+
+    print(f"get_users payload: {args.users} users, {len(fast_users(docs)) / 1024:.1f} KiB")
+    for label, before_fn, after_fn, arg, rounds in (
+        (f"get_users x{args.users}", legacy_users, fast_users, docs, args.rounds),
+        ("get_profile", legacy_profile, fast_profile, docs[0], args.rounds * 50),
+    ):
+        before = cpu_per_call(before_fn, arg, rounds)
+        after = cpu_per_call(after_fn, arg, rounds)
+        print(f"{label:18} before {before:8.3f} ms   after {after:8.3f} ms   ({before / after:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timezone
+
+from server import INDEXES, client, db
+
+NOW = datetime.now(timezone.utc)
+
+# Representative filters for every hot route and background worker, checked
+# with --explain and by tests/test_indexes.py
+HOT_QUERIES = [
+    ("users", {"id": "explain-user"}, None),
+    ("users", {"email_lower": "explain@example.com"}, None),
+    ("users", {"email": "Explain@Example.com"}, None),
+    ("users", {}, [("name", 1), ("id", 1)]),
+    ("users", {"batch": "Turing"}, [("name", 1), ("id", 1)]),
+    ("users", {"name_key": {"$gte": "ad", "$lt": "ad\uffff"}}, [("name_key", 1), ("id", 1)]),
+    ("users", {"name_tokens": {"$all": ["lov", "ad"]}}, [("name_key", 1), ("id", 1)]),
+    ("users", {"name_key": {"$gte": "ad", "$lt": "ad\uffff"}, "batch": "Turing"}, [("name_key", 1), ("id", 1)]),
+    ("users", {}, [("points", -1), ("id", 1)]),
+    ("users", {"batch": "Turing"}, [("points", -1), ("id", 1)]),
+    ("friend_requests", {"id": "explain-request"}, None),
+    ("friend_requests", {"receiver_id": "explain-user", "status": "pending"}, [("created_at", -1), ("id", -1)]),
+    ("friend_requests", {"sender_id": "explain-user", "status": "pending"}, [("created_at", -1), ("id", -1)]),
+    ("friend_requests", {"$or": [
+        {"sender_id": "explain-user", "receiver_id": "explain-other", "status": "pending"},
+        {"sender_id": "explain-other", "receiver_id": "explain-user", "status": "pending"}
+    ]}, None),
+    ("friendships", {"$or": [
+        {"user1_id": "explain-user", "user2_id": "explain-other"},
+        {"user1_id": "explain-other", "user2_id": "explain-user"}
+    ]}, None),
+    ("friendships", {"$or": [{"user1_id": "explain-user"}, {"user2_id": "explain-user"}]}, None),
+    ("friendships", {"$or": [
+        {"user1_id": {"$in": ["explain-user", "explain-other"]}},
+        {"user2_id": {"$in": ["explain-user", "explain-other"]}}
+    ]}, None),
+    ("notifications", {"user_id": "explain-user", "read": False}, [("created_at", -1)]),
+    ("notifications", {"user_id": "explain-user"}, [("created_at", -1), ("id", -1)]),
+    ("notifications", {"id": "explain-notification", "user_id": "explain-user"}, None),
+    ("password_resets", {"token_hash": "explain-token"}, None),
+    ("roadmaps", {"user_id": "explain-user"}, [("created_at", -1), ("id", -1)]),
+    ("problem_completions", {"user_id": "explain-user"}, None),
+    ("problem_progress", {"user_id": "explain-user"}, None),
+    ("problem_bank", {"pool": "python:easy"}, None),
+    ("problem_bank", {"pool": "python:easy", "id": {"$nin": ["explain-problem"]}}, None),
+    ("problem_bank", {"id": "explain-problem"}, None),
+    ("notification_counters", {"user_id": "explain-user"}, None),
+    ("leases", {"name": "explain-lease", "$or": [{"holder": "explain-worker"}, {"expires_at": {"$lt": NOW}}]}, None),
+    ("llm_cache", {"key": "explain-key", "expires_at": {"$gt": NOW}}, None),
+    ("generation_jobs", {"user_id": "explain-user", "status": {"$in": ["queued", "running"]}}, None),
+    ("generation_jobs", {"id": "explain-job", "status": "queued"}, None),
+    ("generation_jobs", {"status": "running", "updated_at": {"$lt": NOW}}, None),
+    ("generation_jobs", {"status": "queued"}, [("created_at", 1)]),
+    ("outbound_mail", {"$or": [
+        {"status": "queued", "next_attempt_at": {"$lte": NOW}},
+        {"status": "sending", "lease_until": {"$lt": NOW}}
+    ]}, [("next_attempt_at", 1)]),
+    ("outbound_mail", {"status": "queued"}, [("next_attempt_at", 1)]),
+]
+
+def print_plan():
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            spec = index.document
+            keys = ", ".join(f"{field}:{direction}" for field, direction in spec['key'].items())
+            unique = " unique" if spec.get('unique') else ""
+            print(f"{collection}.{spec['name']} ({keys}){unique}")
+
+def find_stages(plan, stage):
+    if isinstance(plan, dict):
+        if plan.get('stage') == stage:
+            return True
+        return any(find_stages(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(find_stages(item, stage) for item in plan)
+    return False
+
+async def build():
+    for collection, indexes in INDEXES.items():
+        names = await db[collection].create_indexes(indexes)
+        print(f"{collection}: {', '.join(names)}")
+
+async def uses_collscan(collection: str, query: dict, sort) -> bool:
+    cursor = db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    result = await cursor.explain()
+    return find_stages(result['queryPlanner']['winningPlan'], 'COLLSCAN')
+
+async def explain() -> int:
+    scans = 0
+    for collection, query, sort in HOT_QUERIES:
+        if await uses_collscan(collection, query, sort):
+            scans += 1
+            print(f"COLLSCAN {collection} {query}")
+        else:
+            print(f"ok       {collection} {query}")
+    return scans
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build the MongoDB indexes used by the API")
+    parser.add_argument("--dry-run", action="store_true", help="print the index plan without building")
+    parser.add_argument("--explain", action="store_true", help="fail if any hot query does a COLLSCAN")
+    args = parser.parse_args()
+
+    print_plan()
+    if args.dry_run:
+        return 0
+
+    print("\n--- BUILDING ---")
+    await build()
+
+    if args.explain:
+        print("\n--- EXPLAIN ---")
+        if await explain():
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    code = asyncio.run(main())
+    client.close()
+    sys.exit(code)
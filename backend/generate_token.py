@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import os
 import uuid
 from datetime import datetime, timedelta, timezone
@@ -24,9 +25,10 @@ async def generate_token():
     token = str(uuid.uuid4())
     expires_at = datetime.now(timezone.utc) + timedelta(minutes=15)
     
+    # Stored hashed, matching server.hash_reset_token
     reset_token = {
         "email": email,
-        "token": token,
+        "token_hash": hashlib.sha256(token.encode()).hexdigest(),
         "type": "reset",
         "expires_at": expires_at
     }
@@ -22,9 +22,10 @@ async def debug_db():
     async for user in db.users.find({}, {"email": 1, "name": 1}):
         print(f"User: {user.get('name')} | Email: {user.get('email')}")
         
+    # Only sha256 hashes of the codes are stored; the codes themselves are emailed
     print("\n--- PASSWORD RESET TOKENS ---")
     async for token in db.password_resets.find({}):
-        print(f"Token for: {token.get('email')} | Code: {token.get('token')} | Expires: {token.get('expires_at')}")
+        print(f"Token for: {token.get('email')} | Hash: {token.get('token_hash', '')[:12]}... | Expires: {token.get('expires_at')}")
 
 if __name__ == "__main__":
     asyncio.run(debug_db())
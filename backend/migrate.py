@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from server import INDEXES, UNKNOWN_PROGRESS_KEY, client, db, name_search_fields, normalize_email
+
+async def write_batch(collection, ops, conflicts: Optional[list] = None) -> int:
+    """Apply one unordered batch, reporting (not aborting on) unique-key conflicts.
+
+    Conflicting write errors are appended to `conflicts` when it is given.
+    """
+    try:
+        result = await collection.bulk_write(ops, ordered=False)
+        return result.modified_count + result.upserted_count
+    except BulkWriteError as e:
+        for error in e.details.get('writeErrors', []):
+            if error.get('code') != 11000:
+                raise
+            print(f"  skipped conflicting document: {error.get('errmsg')}")
+            if conflicts is not None:
+                conflicts.append(error)
+        return e.details.get('nModified', 0) + e.details.get('nUpserted', 0)
+
+async def backfill(collection, query, projection, build_update, batch_size: int,
+                   conflicts: Optional[list] = None) -> int:
+    """Stream matching documents and apply `build_update` to them in bulk batches"""
+    ops = []
+    total = 0
+    async for doc in collection.find(query, projection).batch_size(batch_size):
+        ops.append(UpdateOne({"_id": doc['_id']}, build_update(doc)))
+        if len(ops) >= batch_size:
+            total += await write_batch(collection, ops, conflicts)
+            print(f"  {total} documents updated")
+            ops = []
+    if ops:
+        total += await write_batch(collection, ops, conflicts)
+    return total
+
+async def search_keys(batch_size: int) -> int:
+    """Add name_key/name_tokens to users created before indexed search"""
+    return await backfill(
+        db.users,
+        {"name_tokens": {"$exists": False}},
+        {"name": 1},
+        lambda user: {"$set": name_search_fields(user.get('name') or "")},
+        batch_size
+    )
+
+async def email_lower(batch_size: int) -> int:
+    """Add the normalized email_lower lookup key to existing users.
+
+    Accounts whose addresses differ only by case cannot share the key: all
+    but the first are left without it (they still sign in with their exact
+    address) and listed, and the migration exits non-zero so someone merges
+    or renames them.
+    """
+    conflicts = []
+    total = await backfill(
+        db.users,
+        {"email_lower": {"$exists": False}},
+        {"email": 1},
+        lambda user: {"$set": {"email_lower": normalize_email(user.get('email') or "")}},
+        batch_size,
+        conflicts
+    )
+    if conflicts:
+        print(f"  {len(conflicts)} accounts share a case-insensitive email with another account:")
+        for error in conflicts:
+            user = await db.users.find_one({"_id": error['op']['q']['_id']}, {"_id": 0, "id": 1, "email": 1})
+            if not user:
+                continue
+            holder = await db.users.find_one(
+                {"email_lower": normalize_email(user['email'])}, {"_id": 0, "id": 1, "email": 1}
+            ) or {}
+            print(f"    {user['id']} <{user['email']}> conflicts with {holder.get('id')} <{holder.get('email')}>")
+        raise SystemExit(f"email_lower: {total} users updated, {len(conflicts)} conflicts need resolving")
+    return total
+
+async def problem_progress(batch_size: int) -> int:
+    """Drop duplicate completions, stamp track/difficulty on them and rebuild progress counters.
+
+    Counters are rebuilt into a scratch collection and swapped in with one
+    rename, so a failure part-way leaves the live counters untouched.
+    Increments landing while the rebuild runs are lost; run it when
+    completions are quiet. Re-running it also repairs counters left low by
+    a crash between complete_problem's two writes.
+    """
+    duplicates = db.problem_completions.aggregate([
+        {"$group": {"_id": {"user_id": "$user_id", "problem_id": "$problem_id"},
+                    "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True, batchSize=batch_size)
+    removed = 0
+    async for group in duplicates:
+        result = await db.problem_completions.delete_many({"_id": {"$in": group['ids'][1:]}})
+        removed += result.deleted_count
+    print(f"  {removed} duplicate completions removed")
+
+    # Completions recorded before progress counters did not carry their problem's
+    # track; the bank rarely still has it, so most become "unknown"
+    ops = []
+    stamped = 0
+    async for completion in db.problem_completions.find(
+        {"$or": [{"track": None}, {"difficulty": None}]}, {"problem_id": 1}
+    ).batch_size(batch_size):
+        problem = await db.problem_bank.find_one(
+            {"id": completion['problem_id']}, {"_id": 0, "track": 1, "difficulty": 1}
+        ) or {}
+        ops.append(UpdateOne({"_id": completion['_id']}, {"$set": {
+            "track": problem.get('track') or UNKNOWN_PROGRESS_KEY,
+            "difficulty": problem.get('difficulty') or UNKNOWN_PROGRESS_KEY
+        }}))
+        if len(ops) >= batch_size:
+            stamped += await write_batch(db.problem_completions, ops)
+            ops = []
+    if ops:
+        stamped += await write_batch(db.problem_completions, ops)
+    print(f"  {stamped} completions stamped with track/difficulty")
+
+    # $out into an existing collection keeps its indexes, so create them first
+    scratch = db.problem_progress_rebuild
+    await scratch.drop()
+    await scratch.create_indexes(INDEXES["problem_progress"])
+    await db.problem_completions.aggregate([
+        {"$group": {"_id": {"user_id": "$user_id",
+                            "track": {"$ifNull": ["$track", UNKNOWN_PROGRESS_KEY]},
+                            "difficulty": {"$ifNull": ["$difficulty", UNKNOWN_PROGRESS_KEY]}},
+                    "completed": {"$sum": 1}}},
+        {"$project": {"_id": 0, "user_id": "$_id.user_id", "track": "$_id.track",
+                      "difficulty": "$_id.difficulty", "completed": 1}},
+        {"$out": scratch.name}
+    ], allowDiskUse=True).to_list(None)
+    await scratch.rename("problem_progress", dropTarget=True)
+    print(f"  {await db.problem_progress.count_documents({})} progress counters rebuilt")
+    return removed + stamped
+
+async def reset_tokens(batch_size: int) -> int:
+    """Delete password reset tokens stored in plaintext, from before token_hash"""
+    result = await db.password_resets.delete_many({"token_hash": {"$exists": False}})
+    return result.deleted_count
+
+async def unread_counters(batch_size: int) -> int:
+    """Create unread counters for users whose notifications predate them"""
+    rows = db.notifications.aggregate([
+        {"$match": {"read": False}},
+        {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}}
+    ], allowDiskUse=True, batchSize=batch_size)
+    ops = []
+    total = 0
+    async for row in rows:
+        # Only missing counters: live ones are kept exact by writers and the reconciler
+        ops.append(UpdateOne({"user_id": row['_id']}, {"$setOnInsert": {"unread": row['unread']}}, upsert=True))
+        if len(ops) >= batch_size:
+            total += await write_batch(db.notification_counters, ops)
+            ops = []
+    if ops:
+        total += await write_batch(db.notification_counters, ops)
+    return total
+
+# Timestamp fields that used to be written as ISO strings
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "roadmaps": ["created_at"],
+    "friend_requests": ["created_at", "updated_at"],
+    "friendships": ["created_at"],
+    "problem_completions": ["completed_at"],
+}
+
+async def native_dates(batch_size: int) -> int:
+    """Convert ISO-string timestamps to native BSON dates"""
+    total = 0
+    for name, fields in DATE_FIELDS.items():
+        print(f"  {name}: {', '.join(fields)}")
+        total += await backfill(
+            db[name],
+            {"$or": [{field: {"$type": "string"}} for field in fields]},
+            {field: 1 for field in fields},
+            lambda doc, fields=fields: {"$set": {
+                field: datetime.fromisoformat(doc[field])
+                for field in fields if isinstance(doc.get(field), str)
+            }},
+            batch_size
+        )
+    return total
+
+MIGRATIONS = {
+    "search_keys": search_keys,
+    "email_lower": email_lower,
+    "problem_progress": problem_progress,
+    "native_dates": native_dates,
+    "reset_tokens": reset_tokens,
+    "unread_counters": unread_counters,
+}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run one-off data migrations")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"--- {args.migration} ---")
+    total = await MIGRATIONS[args.migration](args.batch_size)
+    print(f"Done: {total} documents updated")
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    client.close()
@@ -1,19 +1,35 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, BackgroundTasks, Request, status
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, field_validator
+from typing import List, Optional, Dict, Any, AsyncIterator
 import uuid
+import json
+import orjson
+import unicodedata
+import re
+import gzip
+import hashlib
+import hmac
+import base64
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-# from emergentintegrations.llm.chat import LlmChat, UserMessage
+from cachetools import TTLCache
 import asyncio
+import time
+import random
+from bisect import bisect_left, insort
+from collections import Counter, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -21,19 +37,180 @@ from email.mime.multipart import MIMEMultipart
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection. Timestamps are stored as native BSON dates and decoded
+# as timezone-aware UTC datetimes, so handlers never parse or localize them.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
 db = client[os.environ['DB_NAME']]
 
+# Index registry: every collection the API queries and the indexes its hot
+# queries rely on. Applied idempotently at startup and by build_indexes.py.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Partial until `python migrate.py email_lower` has backfilled older users
+        IndexModel([("email_lower", ASCENDING)], name="email_lower_unique", unique=True,
+                   partialFilterExpression={"email_lower": {"$exists": True}}),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)], name="name_id"),
+        IndexModel([("name_key", ASCENDING), ("id", ASCENDING)], name="name_key_id"),
+        IndexModel([("name_tokens", ASCENDING), ("name_key", ASCENDING), ("id", ASCENDING)],
+                   name="name_tokens_key_id"),
+        IndexModel([("batch", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)], name="batch_name_id"),
+        IndexModel([("points", DESCENDING), ("id", ASCENDING)], name="points_id"),
+        IndexModel([("batch", ASCENDING), ("points", DESCENDING), ("id", ASCENDING)], name="batch_points_id"),
+    ],
+    "friend_requests": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("receiver_id", ASCENDING), ("status", ASCENDING),
+                    ("created_at", DESCENDING), ("id", DESCENDING)], name="receiver_status_created"),
+        IndexModel([("sender_id", ASCENDING), ("status", ASCENDING),
+                    ("created_at", DESCENDING), ("id", DESCENDING)], name="sender_status_created"),
+    ],
+    "friendships": [
+        IndexModel([("user1_id", ASCENDING), ("user2_id", ASCENDING)], name="user1_user2"),
+        IndexModel([("user2_id", ASCENDING), ("user1_id", ASCENDING)], name="user2_user1"),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING), ("created_at", DESCENDING)],
+                   name="user_read_created"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+                   name="user_created_id"),
+    ],
+    "notification_counters": [
+        IndexModel([("user_id", ASCENDING)], name="user_unique", unique=True),
+    ],
+    "leases": [
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+    ],
+    "password_resets": [
+        # Partial: tokens written before hashing have no token_hash (`python migrate.py reset_tokens`)
+        IndexModel([("token_hash", ASCENDING)], name="token_hash_unique", unique=True,
+                   partialFilterExpression={"token_hash": {"$exists": True}}),
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+    "roadmaps": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+                   name="user_created_id"),
+    ],
+    "llm_cache": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+    "problem_bank": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("pool", ASCENDING), ("created_at", ASCENDING)], name="pool_created"),
+    ],
+    "generation_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created"),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)], name="user_status"),
+    ],
+    "outbound_mail": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+    ],
+    "problem_completions": [
+        IndexModel([("user_id", ASCENDING), ("problem_id", ASCENDING)], name="user_problem_unique", unique=True),
+    ],
+    "problem_progress": [
+        IndexModel([("user_id", ASCENDING), ("track", ASCENDING), ("difficulty", ASCENDING)],
+                   name="user_track_difficulty_unique", unique=True),
+    ],
+}
+
+async def ensure_indexes(database=None) -> Dict[str, List[str]]:
+    """Create every registered index; existing identical indexes are left alone"""
+    database = database if database is not None else db
+    created = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = await database[collection].create_indexes(indexes)
+        except Exception as e:
+            # A conflicting or unbuildable index must not keep the API from serving
+            logger.error(f"Index build failed for {collection}: {e}")
+    return created
+
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 JWT_SECRET = os.environ.get('JWT_SECRET')
 ALGORITHM = "HS256"
 
+# bcrypt is CPU-bound, so hashing runs on a bounded pool instead of the event loop
+HASH_POOL_SIZE = int(os.environ.get('HASH_POOL_SIZE', '4'))
+HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', '64'))
+
+# Authenticated user cache (keyed by user id, invalidated by writers)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+# Friend adjacency cache (per-user friend id sets, invalidated on accept/remove)
+FRIEND_GRAPH_CACHE_SIZE = int(os.environ.get('FRIEND_GRAPH_CACHE_SIZE', '20000'))
+FRIEND_GRAPH_TTL = float(os.environ.get('FRIEND_GRAPH_TTL', '300'))
+# Let read-only endpoints that only need id/name trust the signed JWT claims
+TRUST_JWT_CLAIMS = os.environ.get('TRUST_JWT_CLAIMS', 'false').lower() == 'true'
+
+# The in-memory leaderboard is rebuilt from the users collection this often, which
+# also picks up point changes made by other workers
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', '300'))
+
+# Notification fan-outs above this many recipients run after the response is sent
+FANOUT_INLINE_LIMIT = int(os.environ.get('FANOUT_INLINE_LIMIT', '100'))
+
+# Notification push channel
+NOTIFICATION_HEARTBEAT_SECONDS = float(os.environ.get('NOTIFICATION_HEARTBEAT_SECONDS', '15'))
+NOTIFICATION_STREAM_QUEUE = int(os.environ.get('NOTIFICATION_STREAM_QUEUE', '100'))
+# On a replica set, feed the push channel from a change stream so every worker sees every insert
+NOTIFICATION_CHANGE_STREAMS = os.environ.get('NOTIFICATION_CHANGE_STREAMS', 'false').lower() == 'true'
+# How often the unread counters are re-derived from the notifications themselves
+UNREAD_RECONCILE_SECONDS = float(os.environ.get('UNREAD_RECONCILE_SECONDS', '300'))
+
+# LLM generation: "emergent" for the real model, "stub" for offline runs
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'emergent')
+LLM_MODEL = ("anthropic", "claude-3-7-sonnet-20250219")
+LLM_CACHE_SIZE = int(os.environ.get('LLM_CACHE_SIZE', '1024'))
+LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+
+# Global limits on outbound LLM calls, shared by requests, refills and jobs
+LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', '4'))
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', '120'))
+# Generation jobs: retries with exponential backoff, bounded backlog per user
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get('JOB_RETRY_BASE_SECONDS', '2'))
+JOB_MAX_PENDING_PER_USER = int(os.environ.get('JOB_MAX_PENDING_PER_USER', '5'))
+# Running jobs refresh updated_at this often; four missed beats mark the worker dead
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', '30'))
+
+# Outbound mail. MAIL_HOST/MAIL_PORT/MAIL_STARTTLS can point the sender at a
+# local stand-in, e.g. `python -m aiosmtpd -n -l localhost:8025` with MAIL_STARTTLS=false
+MAIL_HOST = os.environ.get('MAIL_HOST')
+MAIL_PORT = int(os.environ.get('MAIL_PORT', '587'))
+MAIL_STARTTLS = os.environ.get('MAIL_STARTTLS', 'true').lower() == 'true'
+MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', '20'))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', '5'))
+MAIL_RETRY_BASE_SECONDS = float(os.environ.get('MAIL_RETRY_BASE_SECONDS', '10'))
+MAIL_IDLE_SECONDS = float(os.environ.get('MAIL_IDLE_SECONDS', '60'))
+
+# Problem bank: pools per (track, difficulty) are refilled in the background
+PROBLEM_BANK_LOW_WATER = int(os.environ.get('PROBLEM_BANK_LOW_WATER', '20'))
+PROBLEM_BANK_MAX = int(os.environ.get('PROBLEM_BANK_MAX', '500'))
+PROBLEM_BANK_BATCH = int(os.environ.get('PROBLEM_BANK_BATCH', '5'))
+# Most problems one request may ask for; the count drives LLM refills and sampling
+PROBLEM_REQUEST_MAX = int(os.environ.get('PROBLEM_REQUEST_MAX', '20'))
+# Each (track, difficulty) pair is its own pool that costs LLM calls to fill, so
+# requests are limited to these instead of minting a pool per free-text value
+PROBLEM_TRACKS = [t.strip() for t in os.environ.get(
+    'PROBLEM_TRACKS', 'Web Development,App Development,AI / ML,DSA & CP').split(',') if t.strip()]
+PROBLEM_DIFFICULTIES = [d.strip() for d in os.environ.get(
+    'PROBLEM_DIFFICULTIES', 'Easy,Medium,Hard').split(',') if d.strip()]
+
+# /api/metrics is off unless a scrape token is set; scrapers send it as a bearer token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -49,7 +226,7 @@ class UserSignup(BaseModel):
 
 class PasswordResetToken(BaseModel):
     email: EmailStr
-    token: str
+    token_hash: str  # sha256 of the code; the code itself is only ever emailed
     type: str  # "reset" or "magic_link"
     expires_at: datetime
 
@@ -104,10 +281,28 @@ class Roadmap(BaseModel):
     roadmap_data: Dict[str, Any]
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+def known_choice(value: str, choices: List[str], label: str) -> str:
+    """The configured spelling of `value`, matched ignoring case and spacing"""
+    key = ' '.join(value.casefold().split())
+    for choice in choices:
+        if ' '.join(choice.casefold().split()) == key:
+            return choice
+    raise ValueError(f"Unknown {label}, expected one of: {', '.join(choices)}")
+
 class ProblemRequest(BaseModel):
     track: str
     difficulty: str
-    count: int = 5
+    count: int = Field(5, ge=1, le=PROBLEM_REQUEST_MAX)
+
+    @field_validator('track')
+    @classmethod
+    def known_track(cls, value: str) -> str:
+        return known_choice(value, PROBLEM_TRACKS, "track")
+
+    @field_validator('difficulty')
+    @classmethod
+    def known_difficulty(cls, value: str) -> str:
+        return known_choice(value, PROBLEM_DIFFICULTIES, "difficulty")
 
 class Problem(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -147,6 +342,9 @@ class Friendship(BaseModel):
 class FriendRequestAction(BaseModel):
     request_id: str
 
+class FriendshipStatusRequest(BaseModel):
+    user_ids: List[str]
+
 class Notification(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -158,6 +356,101 @@ class Notification(BaseModel):
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Metrics
+class LatencyStats:
+    """Rolling window of latency samples in milliseconds"""
+
+    def __init__(self, window: int = 1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+class HashingPool:
+    """Bounded thread pool for bcrypt work with queue-depth admission control"""
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+        self.workers = workers
+        self.capacity = workers + queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self.queue_wait = LatencyStats()
+        self.hash_time = LatencyStats()
+
+    async def run(self, fn, *args):
+        # Shed load instead of letting logins queue up behind each other unbounded
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"}
+            )
+
+        self.pending += 1
+        timings = {"submitted": time.perf_counter()}
+        loop = asyncio.get_running_loop()
+
+        def timed():
+            timings['started'] = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timings['finished'] = time.perf_counter()
+                # The slot is held until the hash itself ends, even if the request
+                # awaiting it was cancelled; release it on the loop thread
+                loop.call_soon_threadsafe(self._release, timings)
+
+        future = self.executor.submit(timed)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Cancelled while still queued: timed() never runs, so free the slot here
+            if future.cancel():
+                self.pending -= 1
+            raise
+
+    def _release(self, timings: Dict[str, float]):
+        self.pending -= 1
+        self.queue_wait.record((timings['started'] - timings['submitted']) * 1000)
+        self.hash_time.record((timings['finished'] - timings['started']) * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "queue_wait": self.queue_wait.snapshot(),
+            "hash_time": self.hash_time.snapshot(),
+        }
+
+hash_pool = HashingPool(HASH_POOL_SIZE, HASH_QUEUE_LIMIT)
+
 # Helper Functions
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -165,6 +458,53 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hash_pool.run(verify_password, plain_password, hashed_password)
+
+# Name search keys
+SEARCH_PREFIX_MAX = 20
+
+def normalize_name(name: str) -> str:
+    """Accent-stripped, case-folded, whitespace-collapsed form of a name"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+def name_search_fields(name: str) -> Dict[str, Any]:
+    """Stored search fields: the normalized name and every word prefix"""
+    key = normalize_name(name)
+    tokens = {word[:i] for word in key.split() for i in range(1, min(len(word), SEARCH_PREFIX_MAX) + 1)}
+    return {"name_key": key, "name_tokens": sorted(tokens)}
+
+def normalize_email(email: str) -> str:
+    """Lookup key for an email address; stored on users as `email_lower`"""
+    return email.strip().lower()
+
+async def find_user_by_email(email: str, projection: Dict) -> Optional[Dict]:
+    """Case-insensitive lookup on email_lower, then the exact address.
+
+    The fallback (on email_unique) keeps users without email_lower able to
+    sign in: everyone until the backfill has run, and accounts it could not
+    backfill because another account differs from theirs only by case.
+    """
+    user = await db.users.find_one({"email_lower": normalize_email(email)}, projection)
+    if user is None:
+        user = await db.users.find_one({"email": email.strip()}, projection)
+    return user
+
+def hash_reset_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def consume_reset_token(token: str) -> Optional[Dict]:
+    """Validate and use up a reset code in one indexed round trip"""
+    return await db.password_resets.find_one_and_delete(
+        {"token_hash": hash_reset_token(token), "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "email": 1}
+    )
+
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(days=7)):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + expires_delta
@@ -172,34 +512,575 @@ def create_access_token(data: dict, expires_delta: timedelta = timedelta(days=7)
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+def create_user_token(user_id: str, name: str) -> str:
+    return create_access_token(data={"sub": user_id, "name": name})
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+user_cache_stats = {"hits": 0, "misses": 0}
+
+async def load_user(user_id: str) -> Optional[Dict]:
+    """Fetch a user document through the short-TTL cache"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user_cache_stats['misses'] += 1
+        user = await db.users.find_one({"id": user_id}, USER_DOC_PROJECTION)
         if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+            return None
+        user_cache[user_id] = user
+    else:
+        user_cache_stats['hits'] += 1
+    # Handlers mutate the dict they receive, so never hand out the cached one
+    return dict(user)
+
+def invalidate_user(user_id: str):
+    user_cache.pop(user_id, None)
+
+def decode_access_token(credentials: HTTPAuthorizationCredentials) -> Dict:
+    try:
+        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[ALGORITHM])
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return payload
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+    payload = decode_access_token(credentials)
+    user = await load_user(payload["sub"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_current_user_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+    """Resolve only the user's id and name, from the token when TRUST_JWT_CLAIMS is set"""
+    payload = decode_access_token(credentials)
+    if TRUST_JWT_CLAIMS and payload.get("name") is not None:
+        return {"id": payload["sub"], "name": payload["name"]}
+    user = await load_user(payload["sub"])
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_stream_user(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Dict:
+    """Like get_current_user_claims, but also accepts ?token= since EventSource cannot send headers"""
+    if credentials is None:
+        if not token:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return await get_current_user_claims(credentials)
+
+# Pagination
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Stable sort keys: the trailing unique id breaks ties so pages never overlap
+NEWEST_FIRST = [("created_at", DESCENDING), ("id", DESCENDING)]
+BY_NAME = [("name", ASCENDING), ("id", ASCENDING)]
+
+def page_params(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> Dict:
+    """Shared `cursor`/`limit` query parameters for paginated endpoints"""
+    return {"cursor": cursor, "limit": limit}
+
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque cursor holding the sort-key values of the last returned row"""
+    payload = [{"$date": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError("cursor does not match sort keys")
+        return [datetime.fromisoformat(v["$date"]) if isinstance(v, dict) else v for v in payload]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(sort: List[tuple], values: List[Any]) -> Dict:
+    """Match rows strictly after `values` in `sort` order"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+async def keyset_page(collection, query: Dict, sort: List[tuple], cursor: Optional[str],
+                      limit: int, projection: Optional[Dict] = None):
+    """Fetch one page in `sort` order; returns (documents, next_cursor).
+
+    The projection must keep every sort field, since the cursor is built from
+    the last document of the page.
+    """
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(cursor, len(sort)))]}
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([docs[-1].get(field) for field, _ in sort])
+    return docs, next_cursor
+
+def event_notification_id(event_key: str, recipient_id: str) -> str:
+    """Deterministic notification id so a retried event never notifies twice"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"nstrack:{event_key}:{recipient_id}"))
+
+class NotificationHub:
+    """In-process pub/sub of new notifications, keyed by recipient"""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, set] = {}
+        self.overflows = 0
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def publish(self, notification: Dict):
+        for queue in list(self.subscribers.get(notification['user_id'], ())):
+            try:
+                queue.put_nowait(notification)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and tell it to reconnect, the
+                # client then replays what it missed from its last event id
+                self.overflows += 1
+                self.unsubscribe(notification['user_id'], queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.subscribers),
+            "connections": sum(len(queues) for queues in self.subscribers.values()),
+            "overflows": self.overflows,
+        }
+
+notification_hub = NotificationHub(NOTIFICATION_STREAM_QUEUE)
+
+async def insert_notifications(notifications: List["Notification"]) -> int:
+    """Unordered bulk insert; ids that were already delivered are skipped"""
+    if not notifications:
+        return 0
+    docs = [notification.model_dump() for notification in notifications]
+    try:
+        await db.notifications.insert_many(docs, ordered=False)
+        inserted = docs
+    except BulkWriteError as e:
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+        failed = {error['index'] for error in e.details['writeErrors']}
+        inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+    
+    await increment_unread_counts(doc['user_id'] for doc in inserted)
+    
+    if not NOTIFICATION_CHANGE_STREAMS:
+        for doc in inserted:
+            doc.pop('_id', None)
+            notification_hub.publish(doc)
+    return len(inserted)
+
+async def increment_unread_counts(user_ids):
+    """Bump the per-user unread counters for freshly inserted notifications"""
+    counts: Dict[str, int] = {}
+    for user_id in user_ids:
+        counts[user_id] = counts.get(user_id, 0) + 1
+    if counts:
+        await db.notification_counters.bulk_write([
+            UpdateOne({"user_id": user_id}, {"$inc": {"unread": count}}, upsert=True)
+            for user_id, count in counts.items()
+        ], ordered=False)
+
+async def adjust_unread_count(user_id: str, delta: int):
+    if delta:
+        await db.notification_counters.update_one(
+            {"user_id": user_id},
+            {"$inc": {"unread": delta}},
+            upsert=True
+        )
+
+# user id -> (counter value, unread count) that disagreed on the previous pass
+unread_drift: Dict[str, tuple] = {}
+
+async def reconcile_unread_counts() -> int:
+    """Rewrite counters that drifted from the real number of unread notifications.
+
+    Each user is counted over the user_read_created index. Writers change the
+    notifications first and the counter second, so a mismatch seen mid-write
+    is expected and would be made wrong by a fix (the pending $inc lands on
+    top of it). A counter is therefore only rewritten once the same mismatch
+    shows up on two consecutive passes, and only while it still holds the
+    value read. That leaves a write that is in flight during both passes with
+    identical numbers, which is not worth a transaction on every writer.
+    Counters exist for every user with notifications (writers upsert them;
+    older data is backfilled by `python migrate.py unread_counters`).
+    """
+    drift = {}
+    fixed = 0
+    async for counter in db.notification_counters.find({}, {"_id": 0, "user_id": 1, "unread": 1}):
+        user_id, seen = counter['user_id'], counter.get('unread')
+        actual = await db.notifications.count_documents({"user_id": user_id, "read": False})
+        if seen == actual:
+            continue
+        if unread_drift.get(user_id) != (seen, actual):
+            drift[user_id] = (seen, actual)
+            continue
+        result = await db.notification_counters.update_one(
+            {"user_id": user_id, "unread": seen},
+            {"$set": {"unread": actual}}
+        )
+        fixed += result.modified_count
+    unread_drift.clear()
+    unread_drift.update(drift)
+    return fixed
+
+# Identifies this process when it holds a lease on singleton background work
+WORKER_ID = str(uuid.uuid4())
+
+async def acquire_lease(name: str, seconds: float) -> bool:
+    """Take or renew a named, expiring lease so only one worker runs a job"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.leases.update_one(
+            {"name": name, "$or": [{"holder": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"holder": WORKER_ID, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Held by another live worker: the filter missed and the upsert collided
+        return False
+
+async def run_unread_reconciler():
+    while True:
+        await asyncio.sleep(UNREAD_RECONCILE_SECONDS)
+        try:
+            # The holder renews every pass; another worker takes over once it lapses
+            if not await acquire_lease("unread_reconciler", UNREAD_RECONCILE_SECONDS * 2):
+                continue
+            fixed = await reconcile_unread_counts()
+            if fixed:
+                logger.info(f"Reconciled {fixed} unread notification counters")
+        except Exception as e:
+            logger.error(f"Unread counter reconciliation failed: {e}")
+
+async def watch_notifications():
+    """Publish notification inserts from a MongoDB change stream (replica sets only)"""
+    while True:
+        try:
+            async with db.notifications.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                async for change in stream:
+                    doc = change['fullDocument']
+                    doc.pop('_id', None)
+                    notification_hub.publish(doc)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Notification change stream failed, restarting: {e}")
+            await asyncio.sleep(5)
+
+USER_SUMMARY_PROJECTION = {"_id": 0, "id": 1, "name": 1, "batch": 1, "skill_level": 1}
+# Full user document minus the search index fields
+USER_DOC_PROJECTION = {"_id": 0, "name_key": 0, "name_tokens": 0, "email_lower": 0}
+# What other users may see of a user
+PUBLIC_USER_PROJECTION = {**USER_DOC_PROJECTION, "password_hash": 0}
+# Exactly the fields of the User response model
+USER_RESPONSE_PROJECTION = {"_id": 0, **{field: 1 for field in User.model_fields}}
+
+class ModelJSONResponse(ORJSONResponse):
+    """orjson, but with UTC datetimes as "...Z" the way pydantic writes a response_model"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+def json_response(content: Any, status_code: int = 200,
+                  response_class: type = ORJSONResponse) -> ORJSONResponse:
+    """Send documents that are already response-shaped straight to orjson.
+
+    Returning a Response skips FastAPI's jsonable_encoder walk and any
+    response_model re-validation; the Mongo projection that loaded the
+    documents is what decides which fields go out. Endpoints that used to
+    return a model pass ModelJSONResponse to keep its date format.
+    """
+    return response_class(content, status_code=status_code)
+
+def user_response(user: Dict) -> Dict:
+    """A user document cut down to the User response fields, missing ones filled with the model's defaults"""
+    response = {}
+    for field, info in User.model_fields.items():
+        if field in user or info.is_required():
+            response[field] = user.get(field)
+        else:
+            response[field] = info.get_default(call_default_factory=True)
+    return response
+
+def token_response(user: Dict) -> ORJSONResponse:
+    return json_response({
+        "access_token": create_user_token(user['id'], user['name']),
+        "token_type": "bearer",
+        "user": user_response(user),
+    }, response_class=ModelJSONResponse)
+
+async def fetch_user_summaries(user_ids: List[str]) -> Dict[str, Dict]:
+    """Batch-load public user summaries keyed by id in a single round trip"""
+    if not user_ids:
+        return {}
+    users = await db.users.find(
+        {"id": {"$in": list(set(user_ids))}},
+        USER_SUMMARY_PROJECTION
+    ).to_list(None)
+    return {user['id']: user for user in users}
+
+# LLM Clients
+class EmergentLLMClient:
+    """Production client backed by the emergentintegrations chat API"""
+
+    async def complete(self, session_id: str, system_message: str, user_text: str) -> str:
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+        chat = LlmChat(
+            api_key=os.environ.get('EMERGENT_LLM_KEY'),
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(*LLM_MODEL)
+        return await chat.send_message(UserMessage(text=user_text))
+
+    async def stream(self, session_id: str, system_message: str, user_text: str) -> AsyncIterator[str]:
+        # The chat wrapper only exposes whole responses, so this degrades to a single chunk
+        yield await self.complete(session_id, system_message, user_text)
+
+class StubLLMClient:
+    """Offline stand-in that answers in the formats the prompts ask for"""
+
+    def __init__(self, latency: float = 0.0, token_delay: float = 0.0, chunk_size: int = 8):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    async def complete(self, session_id: str, system_message: str, user_text: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(user_text)
+
+    async def stream(self, session_id: str, system_message: str, user_text: str) -> AsyncIterator[str]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self.respond(user_text)
+        for i in range(0, len(response), self.chunk_size):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield response[i:i + self.chunk_size]
+
+    def respond(self, user_text: str) -> str:
+        if "roadmap" in user_text.lower():
+            phases = ["Foundations", "Core Skills", "Advanced Concepts", "Projects & Practice"]
+            return "\n\n".join(
+                f"## Phase {i}: {phase}\n- Topic 1: Description\n- Topic 2: Description"
+                for i, phase in enumerate(phases, 1)
+            )
+        return "\n".join(
+            f"---\nTITLE: Stub problem {i}\nDESCRIPTION: Solve stub problem {i}.\n"
+            f"HINTS: Start small | Generalise\nSOLUTION: Iterate over the input.\n---"
+            for i in range(1, 4)
+        )
+
+class BoundedLLMClient:
+    """Wraps a client with a global concurrency limit and timeouts"""
+
+    def __init__(self, inner, concurrency: int, timeout: float):
+        self.inner = inner
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.active = 0
+        self.timeouts = 0
+
+    async def complete(self, session_id: str, system_message: str, user_text: str) -> str:
+        async with self.semaphore:
+            self.active += 1
+            try:
+                return await asyncio.wait_for(
+                    self.inner.complete(session_id, system_message, user_text), self.timeout
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            finally:
+                self.active -= 1
+
+    async def stream(self, session_id: str, system_message: str, user_text: str) -> AsyncIterator[str]:
+        async with self.semaphore:
+            self.active += 1
+            chunks = self.inner.stream(session_id, system_message, user_text).__aiter__()
+            try:
+                while True:
+                    # Timeout applies between chunks, so long generations are fine while they progress
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    except asyncio.TimeoutError:
+                        self.timeouts += 1
+                        raise
+                    yield chunk
+            finally:
+                self.active -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"concurrency": self.concurrency, "active": self.active, "timeouts": self.timeouts}
+
+if LLM_BACKEND == 'stub':
+    llm_client = StubLLMClient(
+        latency=float(os.environ.get('LLM_STUB_LATENCY', '0')),
+        token_delay=float(os.environ.get('LLM_STUB_TOKEN_DELAY', '0'))
+    )
+else:
+    llm_client = EmergentLLMClient()
+llm_client = BoundedLLMClient(llm_client, LLM_CONCURRENCY, LLM_TIMEOUT_SECONDS)
+
+# LLM Response Cache
+def normalize_prompt_input(value: str) -> str:
+    return ' '.join(value.casefold().split())
+
+def llm_cache_key(kind: str, template: str, **inputs: str) -> str:
+    """Content address for a generation: the model, the prompt template and its normalized inputs.
+
+    Editing a template changes its hash, which invalidates every entry built from it.
+    """
+    material = json.dumps({
+        "kind": kind,
+        "model": LLM_MODEL,
+        "template": hashlib.sha256(template.encode()).hexdigest(),
+        "inputs": {k: normalize_prompt_input(v) for k, v in sorted(inputs.items())},
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+class LLMResponseCache:
+    """Two-tier (in-memory LRU + MongoDB) cache that coalesces identical in-flight generations"""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "coalesced": 0}
+
+    async def get_or_generate(self, key: str, kind: str, generate) -> str:
+        if key in self.memory:
+            self.stats['memory_hits'] += 1
+            return self.memory[key]
+        
+        task = self.inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            task = asyncio.ensure_future(self._load_or_generate(key, kind, generate))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # Shielded so one caller disconnecting does not cancel the shared call
+        return await asyncio.shield(task)
+
+    async def _load_or_generate(self, key: str, kind: str, generate) -> str:
+        content = await self.load(key)
+        if content is None:
+            self.stats['misses'] += 1
+            content = await generate()
+            await self.store(key, kind, content)
+        return content
+
+    async def load(self, key: str) -> Optional[str]:
+        """Look a generation up in the memory tier, then the Mongo tier"""
+        if key in self.memory:
+            self.stats['memory_hits'] += 1
+            return self.memory[key]
+        cached = await db.llm_cache.find_one(
+            {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 0, "content": 1}
+        )
+        if cached is None:
+            return None
+        self.stats['db_hits'] += 1
+        self.memory[key] = cached['content']
+        return cached['content']
+
+    async def store(self, key: str, kind: str, content: str):
+        now = datetime.now(timezone.utc)
+        self.memory[key] = content
+        await db.llm_cache.update_one(
+            {"key": key},
+            {"$set": {
+                "kind": kind,
+                "content": content,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds)
+            }},
+            upsert=True
+        )
+
+    async def invalidate(self, kind: Optional[str] = None) -> int:
+        """Drop cached generations, optionally only those of one kind"""
+        self.memory.clear()
+        result = await db.llm_cache.delete_many({"kind": kind} if kind else {})
+        return result.deleted_count
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"size": len(self.memory), "inflight": len(self.inflight), **self.stats}
+
+llm_cache = LLMResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL)
+
+ROADMAP_SYSTEM_PROMPT = """You are an expert learning path advisor for NSTrack, a platform for NST college students.
+Create personalized learning roadmaps that are:
+- Structured in clear phases (Basics, Core, Advanced, Practice)
+- Action-oriented with bullet points
+- Include specific topics and milestones
+- Practical and project-based
+
+Student Context:
+- Track: {track}
+- Current Level: {current_level}
+- Goals: {goals}
+- Time Available: {time_availability}
+
+Provide a comprehensive roadmap in this format:
+
+## Phase 1: Foundations
+- Topic 1: Description
+- Topic 2: Description
 
-# Initialize LLM Chat
-async def get_llm_chat(session_id: str, system_message: str):
-    return LlmChat(
-        api_key=os.environ.get('EMERGENT_LLM_KEY'),
-        session_id=session_id,
-        system_message=system_message
-    ).with_model("anthropic", "claude-3-7-sonnet-20250219")
+## Phase 2: Core Skills
+- Topic 1: Description
+- Topic 2: Description
+
+## Phase 3: Advanced Concepts
+- Topic 1: Description
+- Topic 2: Description
+
+## Phase 4: Projects & Practice
+- Project 1: Description
+- Project 2: Description
+"""
 
 # Routes
 @api_router.post("/auth/signup", response_model=TokenResponse)
 async def signup(user_data: UserSignup):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    email_lower = normalize_email(user_data.email)
+    existing_user = await find_user_by_email(user_data.email, {"_id": 1})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -218,202 +1099,227 @@ async def signup(user_data: UserSignup):
     )
     
     user_dict = user.model_dump()
-    user_dict['password_hash'] = hash_password(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['password_hash'] = await hash_password_async(user_data.password)
+    user_dict['email_lower'] = email_lower
+    user_dict.update(name_search_fields(user.name))
     
-    await db.users.insert_one(user_dict)
-    
-    # Create token
-    access_token = create_access_token(data={"sub": user.id})
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup for the same address
+        raise HTTPException(status_code=400, detail="Email already registered")
+    leaderboard.update(user.id, user.batch, user.points)
     
-    return TokenResponse(access_token=access_token, user=user)
+    return token_response(user_dict)
 
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user['password_hash']):
+    user = await find_user_by_email(credentials.email, USER_DOC_PROJECTION)
+    if not user or not await verify_password_async(credentials.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    # Convert ISO string to datetime if needed
-    if isinstance(user['created_at'], str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    
-    user_obj = User(**{k: v for k, v in user.items() if k != 'password_hash'})
-    access_token = create_access_token(data={"sub": user_obj.id})
-    
-    return TokenResponse(access_token=access_token, user=user_obj)
+    return token_response(user)
 
 @api_router.get("/auth/profile", response_model=User)
 async def get_profile(current_user: Dict = Depends(get_current_user)):
-    if isinstance(current_user['created_at'], str):
-        current_user['created_at'] = datetime.fromisoformat(current_user['created_at'])
-    return User(**{k: v for k, v in current_user.items() if k != 'password_hash'})
+    return json_response(user_response(current_user), response_class=ModelJSONResponse)
 
 @api_router.put("/auth/profile", response_model=User)
 async def update_profile(update_data: ProfileUpdate, current_user: Dict = Depends(get_current_user)):
     update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
     
-    if update_dict:
-        await db.users.update_one(
-            {"id": current_user['id']},
-            {"$set": update_dict}
-        )
-    
-    updated_user = await db.users.find_one({"id": current_user['id']}, {"_id": 0})
-    if isinstance(updated_user['created_at'], str):
-        updated_user['created_at'] = datetime.fromisoformat(updated_user['created_at'])
+    if not update_dict:
+        return json_response(user_response(current_user), response_class=ModelJSONResponse)
     
-    return User(**{k: v for k, v in updated_user.items() if k != 'password_hash'})
-
-@api_router.post("/roadmap/generate")
-async def generate_roadmap(request: RoadmapRequest, current_user: Dict = Depends(get_current_user)):
-    session_id = f"roadmap_{current_user['id']}_{request.track}"
-    
-    system_message = f"""You are an expert learning path advisor for NSTrack, a platform for NST college students.
-Create personalized learning roadmaps that are:
-- Structured in clear phases (Basics, Core, Advanced, Practice)
-- Action-oriented with bullet points
-- Include specific topics and milestones
-- Practical and project-based
-
-Student Context:
-- Track: {request.track}
-- Current Level: {request.current_level}
-- Goals: {request.goals}
-- Time Available: {request.time_availability}
-
-Provide a comprehensive roadmap in this format:
-
-## Phase 1: Foundations
-- Topic 1: Description
-- Topic 2: Description
-
-## Phase 2: Core Skills
-- Topic 1: Description
-- Topic 2: Description
-
-## Phase 3: Advanced Concepts
-- Topic 1: Description
-- Topic 2: Description
+    updated_user = await db.users.find_one_and_update(
+        {"id": current_user['id']},
+        {"$set": update_dict},
+        projection=USER_RESPONSE_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_user(current_user['id'])
+    leaderboard.update(updated_user['id'], updated_user.get('batch'), updated_user.get('points', 0))
+    
+    return json_response(user_response(updated_user), response_class=ModelJSONResponse)
+
+def roadmap_prompt(request: RoadmapRequest) -> tuple:
+    """(cache key, system message, user text) for a roadmap request"""
+    inputs = {
+        "track": request.track,
+        "current_level": request.current_level,
+        "goals": request.goals,
+        "time_availability": request.time_availability,
+    }
+    key = llm_cache_key("roadmap", ROADMAP_SYSTEM_PROMPT, **inputs)
+    return key, ROADMAP_SYSTEM_PROMPT.format(**inputs), f"Generate a complete roadmap for {request.track}"
 
-## Phase 4: Projects & Practice
-- Project 1: Description
-- Project 2: Description
-"""
-    
-    chat = await get_llm_chat(session_id, system_message)
-    user_message = UserMessage(text=f"Generate a complete roadmap for {request.track}")
-    
-    response = await chat.send_message(user_message)
-    
-    # Save roadmap
+async def save_roadmap(user_id: str, request: RoadmapRequest, content: str) -> str:
     roadmap = Roadmap(
-        user_id=current_user['id'],
+        user_id=user_id,
         track=request.track,
         roadmap_data={
-            "content": response,
+            "content": content,
             "goals": request.goals,
             "time_availability": request.time_availability,
             "current_level": request.current_level
         }
     )
     
-    roadmap_dict = roadmap.model_dump()
-    roadmap_dict['created_at'] = roadmap_dict['created_at'].isoformat()
+    await db.roadmaps.insert_one(roadmap.model_dump())
+    return roadmap.id
+
+def dump_json(value: Any) -> str:
+    return json.dumps(value, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+def ndjson(event: Dict) -> str:
+    return dump_json(event) + "\n"
+
+async def iter_lines(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Re-split a token stream into complete lines"""
+    buffer = ""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+async def iter_roadmap_phases(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Yield each `## Phase` section as soon as the next one starts"""
+    phase = []
+    async for line in iter_lines(chunks):
+        if line.startswith('## ') and phase:
+            yield '\n'.join(phase).strip()
+            phase = []
+        if phase or line.startswith('## '):
+            phase.append(line)
+    if phase:
+        yield '\n'.join(phase).strip()
+
+async def single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+@api_router.post("/roadmap/generate")
+async def generate_roadmap(request: RoadmapRequest, current_user: Dict = Depends(get_current_user)):
+    key, system_message, user_text = roadmap_prompt(request)
+    
+    async def generate():
+        return await llm_client.complete(f"roadmap_{key[:16]}", system_message, user_text)
     
-    await db.roadmaps.insert_one(roadmap_dict)
+    response = await llm_cache.get_or_generate(key, "roadmap", generate)
+    roadmap_id = await save_roadmap(current_user['id'], request, response)
     
-    return {"roadmap_id": roadmap.id, "content": response}
+    return {"roadmap_id": roadmap_id, "content": response}
+
+@api_router.post("/roadmap/generate/stream")
+async def stream_roadmap(request: RoadmapRequest, current_user: Dict = Depends(get_current_user)):
+    """Stream roadmap phases as NDJSON while the LLM writes them"""
+    key, system_message, user_text = roadmap_prompt(request)
+    
+    async def events():
+        cached = await llm_cache.load(key)
+        if cached is not None:
+            chunks = single_chunk(cached)
+        else:
+            chunks = llm_client.stream(f"roadmap_{key[:16]}", system_message, user_text)
+        
+        parts = []
+        
+        async def recorded():
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        
+        try:
+            index = 0
+            async for phase in iter_roadmap_phases(recorded()):
+                index += 1
+                yield ndjson({"type": "phase", "index": index, "content": phase})
+        except Exception as e:
+            logger.error(f"Roadmap stream failed: {e}")
+            yield ndjson({"type": "error", "detail": "Roadmap generation failed"})
+            return
+        
+        content = ''.join(parts)
+        if cached is None:
+            await llm_cache.store(key, "roadmap", content)
+        roadmap_id = await save_roadmap(current_user['id'], request, content)
+        yield ndjson({"type": "done", "roadmap_id": roadmap_id, "content": content})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
 @api_router.get("/roadmap/{user_id}")
-async def get_user_roadmaps(user_id: str, current_user: Dict = Depends(get_current_user)):
+async def get_user_roadmaps(user_id: str, page: Dict = Depends(page_params),
+                            current_user: Dict = Depends(get_current_user_claims)):
     if current_user['id'] != user_id:
         raise HTTPException(status_code=401, detail="Access denied")
     
-    roadmaps = await db.roadmaps.find({"user_id": user_id}, {"_id": 0}).to_list(100)
-    return roadmaps
+    roadmaps, next_cursor = await keyset_page(
+        db.roadmaps, {"user_id": user_id}, NEWEST_FIRST, page['cursor'], page['limit'], {"_id": 0}
+    )
+    return json_response({"roadmaps": roadmaps, "next_cursor": next_cursor})
+
+# Language curriculum: loaded once, served as pre-serialized, pre-compressed bytes
+CURRICULUM_PATH = ROOT_DIR / 'data' / 'language_structure.json'
+CURRICULUM_CACHE_CONTROL = "public, max-age=3600"
+
+def precompile_json(payload: Dict) -> Dict[str, Any]:
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=9),
+        # Strong ETags must differ per content-coding
+        "etag": f'"{digest}"',
+        "gzip_etag": f'"{digest}-gz"',
+    }
+
+def load_curriculum(path: Path) -> Dict[tuple, Dict[str, Any]]:
+    """Pre-render every (language, section) response; section None is the whole language"""
+    with open(path, encoding='utf-8') as f:
+        structure = json.load(f)
+    responses = {}
+    for lang, sections in structure.items():
+        responses[(lang, None)] = precompile_json({"language": lang, "structure": sections})
+        for section, content in sections.items():
+            responses[(lang, section)] = precompile_json({"language": lang, "section": section, "content": content})
+    return responses
+
+curriculum = load_curriculum(CURRICULUM_PATH)
+
+def etag_matches(if_none_match: Optional[str], *etags: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in candidates or any(etag in candidates for etag in etags)
 
 @api_router.get("/languages/{lang}")
-async def get_language_content(lang: str, section: Optional[str] = None):
-    # Static structure with AI-enhanced examples
-    language_structure = {
-        "python": {
-            "introduction": {"title": "Introduction to Python", "topics": ["Purpose", "Where Used", "Advantages"]},
-            "setup": {"title": "Setup & First Program", "topics": ["Installation", "Hello World"]},
-            "syntax": {"title": "Basic Syntax", "topics": ["Indentation", "Comments", "Variables"]},
-            "datatypes": {"title": "Data Types", "topics": ["Numbers", "Strings", "Lists", "Tuples", "Dictionaries"]},
-            "operators": {"title": "Operators", "topics": ["Arithmetic", "Comparison", "Logical", "Assignment"]},
-            "conditionals": {"title": "Conditionals", "topics": ["if", "elif", "else"]},
-            "loops": {"title": "Loops", "topics": ["for loop", "while loop", "break/continue"]},
-            "functions": {"title": "Functions", "topics": ["Definition", "Parameters", "Return", "Lambda"]},
-            "datastructures": {"title": "Data Structures", "topics": ["Lists", "Tuples", "Sets", "Dictionaries"]},
-            "oop": {"title": "Object-Oriented Programming", "topics": ["Classes", "Objects", "Inheritance", "Polymorphism"]},
-            "modules": {"title": "Libraries & Modules", "topics": ["Import", "Built-in Modules", "pip"]},
-            "advanced": {"title": "Advanced Concepts", "topics": ["Decorators", "Generators", "Exception Handling"]},
-            "projects": {"title": "Real-World Projects", "topics": ["Calculator", "To-Do List", "Web Scraper", "API Client", "Data Analyzer"]},
-            "practice": {"title": "Practice Questions", "topics": ["Easy", "Medium", "Hard"]}
-        },
-        "java": {
-            "introduction": {"title": "Introduction to Java", "topics": ["Purpose", "Where Used", "Advantages"]},
-            "setup": {"title": "Setup & First Program", "topics": ["JDK Installation", "Hello World"]},
-            "syntax": {"title": "Basic Syntax", "topics": ["Classes", "Methods", "Variables"]},
-            "datatypes": {"title": "Data Types", "topics": ["Primitive Types", "Reference Types", "Arrays"]},
-            "operators": {"title": "Operators", "topics": ["Arithmetic", "Comparison", "Logical", "Bitwise"]},
-            "conditionals": {"title": "Conditionals", "topics": ["if-else", "switch", "ternary"]},
-            "loops": {"title": "Loops", "topics": ["for", "while", "do-while", "enhanced for"]},
-            "functions": {"title": "Methods", "topics": ["Declaration", "Parameters", "Return Types", "Overloading"]},
-            "datastructures": {"title": "Data Structures", "topics": ["ArrayList", "HashMap", "LinkedList", "Stack", "Queue"]},
-            "oop": {"title": "Object-Oriented Programming", "topics": ["Classes", "Objects", "Inheritance", "Polymorphism", "Encapsulation", "Abstraction"]},
-            "modules": {"title": "Packages & Libraries", "topics": ["Import", "java.util", "java.io", "java.lang"]},
-            "advanced": {"title": "Advanced Concepts", "topics": ["Interfaces", "Abstract Classes", "Exception Handling", "Threads"]},
-            "projects": {"title": "Real-World Projects", "topics": ["Banking System", "Library Management", "Chat Application", "E-commerce Backend"]},
-            "practice": {"title": "Practice Questions", "topics": ["Easy", "Medium", "Hard"]}
-        },
-        "cpp": {
-            "introduction": {"title": "Introduction to C++", "topics": ["Purpose", "Where Used", "Advantages"]},
-            "setup": {"title": "Setup & First Program", "topics": ["Compiler Setup", "Hello World"]},
-            "syntax": {"title": "Basic Syntax", "topics": ["Structure", "Namespaces", "Comments"]},
-            "datatypes": {"title": "Data Types", "topics": ["int", "float", "char", "bool", "string", "arrays"]},
-            "operators": {"title": "Operators", "topics": ["Arithmetic", "Comparison", "Logical", "Bitwise"]},
-            "conditionals": {"title": "Conditionals", "topics": ["if-else", "switch"]},
-            "loops": {"title": "Loops", "topics": ["for", "while", "do-while"]},
-            "functions": {"title": "Functions", "topics": ["Declaration", "Parameters", "Return", "Function Overloading"]},
-            "datastructures": {"title": "Data Structures", "topics": ["Arrays", "Vectors", "Maps", "Sets", "Stacks", "Queues"]},
-            "oop": {"title": "Object-Oriented Programming", "topics": ["Classes", "Objects", "Inheritance", "Polymorphism", "Encapsulation"]},
-            "modules": {"title": "STL & Libraries", "topics": ["iostream", "vector", "algorithm", "string"]},
-            "advanced": {"title": "Advanced Concepts", "topics": ["Pointers", "References", "Memory Management", "Templates"]},
-            "projects": {"title": "Real-World Projects", "topics": ["Game Engine", "File Compressor", "Network Chat", "Database System"]},
-            "practice": {"title": "Practice Questions", "topics": ["Easy", "Medium", "Hard"]}
-        },
-        "javascript": {
-            "introduction": {"title": "Introduction to JavaScript", "topics": ["Purpose", "Where Used", "Advantages"]},
-            "setup": {"title": "Setup & First Program", "topics": ["Browser Console", "Node.js", "Hello World"]},
-            "syntax": {"title": "Basic Syntax", "topics": ["Statements", "Comments", "Variables"]},
-            "datatypes": {"title": "Data Types", "topics": ["String", "Number", "Boolean", "Array", "Object"]},
-            "operators": {"title": "Operators", "topics": ["Arithmetic", "Comparison", "Logical", "Ternary"]},
-            "conditionals": {"title": "Conditionals", "topics": ["if-else", "switch"]},
-            "loops": {"title": "Loops", "topics": ["for", "while", "forEach", "map"]},
-            "functions": {"title": "Functions", "topics": ["Declaration", "Arrow Functions", "Callbacks", "Async/Await"]},
-            "datastructures": {"title": "Data Structures", "topics": ["Arrays", "Objects", "Maps", "Sets"]},
-            "oop": {"title": "Object-Oriented Programming", "topics": ["Classes", "Objects", "Inheritance", "Prototypes"]},
-            "modules": {"title": "Modules & Libraries", "topics": ["Import/Export", "npm", "Popular Libraries"]},
-            "advanced": {"title": "Advanced Concepts", "topics": ["Closures", "Promises", "Event Loop", "DOM Manipulation"]},
-            "projects": {"title": "Real-World Projects", "topics": ["Todo App", "Weather App", "Chat App", "E-commerce Frontend"]},
-            "practice": {"title": "Practice Questions", "topics": ["Easy", "Medium", "Hard"]}
-        }
-    }
-    
-    if lang.lower() not in language_structure:
+async def get_language_content(lang: str, request: Request, section: Optional[str] = None):
+    lang = lang.lower()
+    if (lang, None) not in curriculum:
         raise HTTPException(status_code=404, detail="Language not found")
     
-    return {"language": lang, "structure": language_structure[lang.lower()]}
-
-@api_router.post("/problems/generate")
-async def generate_problems(request: ProblemRequest, current_user: Dict = Depends(get_current_user)):
-    session_id = f"problems_{request.track}_{request.difficulty}"
+    entry = curriculum.get((lang, section.lower() if section else None))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Section not found")
+    
+    use_gzip = 'gzip' in request.headers.get('accept-encoding', '')
+    headers = {
+        "ETag": entry['gzip_etag'] if use_gzip else entry['etag'],
+        "Cache-Control": CURRICULUM_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get('if-none-match'), entry['etag'], entry['gzip_etag']):
+        return Response(status_code=304, headers=headers)
     
-    system_message = f"""You are a coding problem generator for NSTrack platform.
-Generate {request.count} {request.difficulty} level problems for {request.track}.
+    if use_gzip:
+        return Response(content=entry['gzip'], media_type="application/json",
+                        headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=entry['body'], media_type="application/json", headers=headers)
+
+PROBLEM_SYSTEM_PROMPT = """You are a coding problem generator for NSTrack platform.
+Generate {count} {difficulty} level problems for {track}.
 
 **SPECIAL INSTRUCTIONS FOR HTML/CSS PROBLEMS:**
 When generating HTML/CSS problems, include these requirements in the description:
@@ -460,75 +1366,690 @@ HINTS: [hint1] | [hint2] | [hint3]
 SOLUTION: [solution approach]
 ---
 """
-    
-    chat = await get_llm_chat(session_id, system_message)
-    user_message = UserMessage(text=f"Generate {request.count} problems")
-    
-    response = await chat.send_message(user_message)
-    
-    # Parse response into problem objects
-    problems = []
-    problem_blocks = response.split('---')
-    
-    for block in problem_blocks:
-        if 'TITLE:' in block:
-            lines = block.strip().split('\n')
-            title = ""
-            description = ""
-            hints = []
-            solution = ""
-            
-            for line in lines:
-                if line.startswith('TITLE:'):
-                    title = line.replace('TITLE:', '').strip()
-                elif line.startswith('DESCRIPTION:'):
-                    description = line.replace('DESCRIPTION:', '').strip()
-                elif line.startswith('HINTS:'):
-                    hints_str = line.replace('HINTS:', '').strip()
-                    hints = [h.strip() for h in hints_str.split('|')]
-                elif line.startswith('SOLUTION:'):
-                    solution = line.replace('SOLUTION:', '').strip()
-            
-            if title:
-                problem = Problem(
-                    track=request.track,
-                    difficulty=request.difficulty,
-                    title=title,
-                    description=description,
-                    hints=hints if hints else ["Think about the problem step by step"],
-                    solution_approach=solution if solution else "Break down the problem into smaller parts"
-                )
-                problems.append(problem.model_dump())
-    
+
+PROBLEM_FIELD_RE = re.compile(r'^\s*\**\s*(TITLE|DESCRIPTION|HINTS|SOLUTION)\s*\**\s*:\s*\**\s*(.*)$')
+PROBLEM_SEPARATOR_RE = re.compile(r'^\s*-{3,}\s*$')
+HINT_BULLET_RE = re.compile(r'^\s*(?:[-*\u2022]|\d+[.)])\s+')
+
+class ProblemParser:
+    """Single-pass, incremental parser for the TITLE/DESCRIPTION/HINTS/SOLUTION block format.
+
+    feed() takes arbitrary chunks of model output and returns the problems whose
+    block closed inside them; close() flushes the last block. Fields may span
+    several lines. Anything the parser had to skip or guess is recorded in
+    `diagnostics` as {"line", "code", "message"} dicts.
+    """
+
+    def __init__(self, track: str, difficulty: str):
+        self.track = track
+        self.difficulty = difficulty
+        self.partial: List[str] = []
+        self.line_no = 0
+        self.fields: Dict[str, List[str]] = {}
+        self.field: Optional[str] = None
+        self.block_start = 1
+        self.diagnostics: List[Dict[str, Any]] = []
+
+    def feed(self, chunk: str) -> List[Problem]:
+        if '\n' not in chunk:
+            self.partial.append(chunk)
+            return []
+        head, *lines = chunk.split('\n')
+        self.partial.append(head)
+        lines.insert(0, ''.join(self.partial))
+        self.partial = [lines.pop()]
+        problems = []
+        for line in lines:
+            problem = self.line(line)
+            if problem is not None:
+                problems.append(problem)
+        return problems
+
+    def close(self) -> List[Problem]:
+        problems = []
+        if self.partial:
+            problem = self.line(''.join(self.partial))
+            self.partial = []
+            if problem is not None:
+                problems.append(problem)
+        problem = self.finish_block()
+        if problem is not None:
+            problems.append(problem)
+        return problems
+
+    def diagnose(self, code: str, message: str, line: Optional[int] = None):
+        self.diagnostics.append({"line": line or self.line_no, "code": code, "message": message})
+
+    def line(self, line: str) -> Optional[Problem]:
+        self.line_no += 1
+        # Substring checks first: most lines are field text and need neither regex
+        if '---' in line and PROBLEM_SEPARATOR_RE.match(line):
+            return self.finish_block()
+        
+        match = PROBLEM_FIELD_RE.match(line) if ':' in line else None
+        if match:
+            name, value = match.group(1).lower(), match.group(2)
+            problem = None
+            if name in self.fields:
+                if name == 'title':
+                    # A second TITLE means the model skipped the separator
+                    self.diagnose("missing_separator", "TITLE repeated before '---'; starting a new problem")
+                    problem = self.finish_block()
+                else:
+                    self.diagnose("duplicate_field", f"{name.upper()} repeated; later value appended")
+            if not self.fields:
+                self.block_start = self.line_no
+            self.field = name
+            self.fields.setdefault(name, []).append(value)
+            return problem
+        
+        if self.field is not None:
+            self.fields[self.field].append(line)
+        elif line.strip():
+            self.diagnose("stray_text", "Text outside any field ignored")
+        return None
+
+    def finish_block(self) -> Optional[Problem]:
+        fields, self.fields, self.field = self.fields, {}, None
+        if not fields:
+            return None
+        
+        title = ' '.join(' '.join(fields.get('title', [])).split())
+        if not title:
+            self.diagnose("missing_title", "Problem block without TITLE dropped", self.block_start)
+            return None
+        
+        description = '\n'.join(fields.get('description', [])).strip()
+        solution = '\n'.join(fields.get('solution', [])).strip()
+        hints = self.split_hints(fields.get('hints', []))
+        if not description:
+            self.diagnose("missing_description", f"'{title}' has no DESCRIPTION", self.block_start)
+        
+        return Problem(
+            track=self.track,
+            difficulty=self.difficulty,
+            title=title,
+            description=description,
+            hints=hints if hints else ["Think about the problem step by step"],
+            solution_approach=solution if solution else "Break down the problem into smaller parts"
+        )
+
+    @staticmethod
+    def split_hints(lines: List[str]) -> List[str]:
+        text = '\n'.join(lines).strip()
+        if not text:
+            return []
+        if '|' in text:
+            parts = text.split('|')
+        else:
+            # One hint per line when the model used a list instead of pipes
+            parts = text.split('\n')
+        return [HINT_BULLET_RE.sub('', part).strip() for part in parts if part.strip()]
+
+def parse_problems(response: str, track: str, difficulty: str) -> List[Problem]:
+    """Parse a complete generation in one pass"""
+    parser = ProblemParser(track, difficulty)
+    problems = parser.feed(response)
+    problems += parser.close()
+    if parser.diagnostics:
+        logger.warning(f"Problem parser diagnostics for {track}/{difficulty}: {parser.diagnostics}")
+    return problems
+
+def problem_pool(track: str, difficulty: str) -> str:
+    return f"{normalize_prompt_input(track)}:{normalize_prompt_input(difficulty)}"
+
+class ProblemBank:
+    """Persistent pools of generated problems, refilled off the request path"""
+
+    def __init__(self, low_water: int, max_size: int, batch: int):
+        self.low_water = low_water
+        self.max_size = max_size
+        self.batch = batch
+        self.refills: Dict[str, asyncio.Task] = {}
+        self.stats = {"served": 0, "refills": 0, "generated": 0, "failed_refills": 0}
+
+    async def generate_batch(self, track: str, difficulty: str) -> int:
+        pool = problem_pool(track, difficulty)
+        system_message = PROBLEM_SYSTEM_PROMPT.format(count=self.batch, difficulty=difficulty, track=track)
+        response = await llm_client.complete(f"problems_{pool}", system_message, f"Generate {self.batch} problems")
+        return await self.store(track, difficulty, parse_problems(response, track, difficulty))
+
+    async def store(self, track: str, difficulty: str, problems: List[Problem]) -> int:
+        now = datetime.now(timezone.utc)
+        pool = problem_pool(track, difficulty)
+        docs = [{**problem.model_dump(), "pool": pool, "created_at": now} for problem in problems]
+        if docs:
+            await db.problem_bank.insert_many(docs)
+        self.stats['generated'] += len(docs)
+        return len(docs)
+
+    async def _refill(self, track: str, difficulty: str, target: int):
+        pool = problem_pool(track, difficulty)
+        self.stats['refills'] += 1
+        try:
+            size = await db.problem_bank.count_documents({"pool": pool})
+            while size < target:
+                added = await self.generate_batch(track, difficulty)
+                if not added:
+                    break
+                size += added
+        except Exception as e:
+            self.stats['failed_refills'] += 1
+            logger.error(f"Problem bank refill failed for {pool}: {e}")
+
+    def refill(self, track: str, difficulty: str, target: int) -> asyncio.Task:
+        """Start (or join) the single refill task for a pool"""
+        pool = problem_pool(track, difficulty)
+        task = self.refills.get(pool)
+        if task is None:
+            task = asyncio.create_task(self._refill(track, difficulty, min(target, self.max_size)))
+            self.refills[pool] = task
+            task.add_done_callback(lambda _: self.refills.pop(pool, None))
+        return task
+
+    async def sample(self, pool: str, ids: Dict, count: int) -> List[Dict]:
+        return await db.problem_bank.aggregate([
+            {"$match": {"pool": pool, "id": ids}},
+            {"$sample": {"size": count}},
+            {"$project": {"_id": 0, "pool": 0, "created_at": 0}}
+        ]).to_list(count)
+
+    async def serve(self, track: str, difficulty: str, count: int, user_id: str) -> List[Dict]:
+        """Random problems from the pool, ones the user has not completed first"""
+        pool = problem_pool(track, difficulty)
+        seen = await db.problem_completions.distinct("problem_id", {"user_id": user_id})
+        size = await db.problem_bank.count_documents({"pool": pool})
+        if size == 0:
+            # Cold pool: wait for the first batch, the rest fills in the background
+            await asyncio.shield(self.refill(track, difficulty, count))
+        
+        problems = await self.sample(pool, {"$nin": seen}, count)
+        unseen = len(problems)
+        if unseen < count and seen:
+            problems += await self.sample(pool, {"$in": seen}, count - unseen)
+        if not problems:
+            raise HTTPException(status_code=503, detail="Problem generation is unavailable, please try again")
+        
+        # Keep a floor of problems per pool, and grow it once this user has seen it all
+        if size < self.low_water or unseen < count:
+            self.refill(track, difficulty, max(self.low_water, size + count))
+        self.stats['served'] += len(problems)
+        return problems
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"refilling": sorted(self.refills), **self.stats}
+
+problem_bank = ProblemBank(PROBLEM_BANK_LOW_WATER, PROBLEM_BANK_MAX, PROBLEM_BANK_BATCH)
+
+@api_router.post("/problems/generate")
+async def generate_problems(request: ProblemRequest, current_user: Dict = Depends(get_current_user)):
+    """Serve problems from the bank; generation happens in the background"""
+    problems = await problem_bank.serve(request.track, request.difficulty, request.count, current_user['id'])
     return {"problems": problems}
 
+async def iter_problems(chunks: AsyncIterator[str], parser: ProblemParser) -> AsyncIterator[Problem]:
+    """Yield problems from a token stream as each block completes"""
+    async for chunk in chunks:
+        for problem in parser.feed(chunk):
+            yield problem
+    for problem in parser.close():
+        yield problem
+
+@api_router.post("/problems/generate/stream")
+async def stream_problems(request: ProblemRequest, current_user: Dict = Depends(get_current_user)):
+    """Generate fresh problems, streaming each as NDJSON once parsed, and add them to the bank"""
+    pool = problem_pool(request.track, request.difficulty)
+    system_message = PROBLEM_SYSTEM_PROMPT.format(
+        count=request.count, difficulty=request.difficulty, track=request.track
+    )
+    
+    async def events():
+        chunks = llm_client.stream(f"problems_{pool}", system_message, f"Generate {request.count} problems")
+        parser = ProblemParser(request.track, request.difficulty)
+        problems = []
+        try:
+            async for problem in iter_problems(chunks, parser):
+                problems.append(problem)
+                yield ndjson({"type": "problem", "problem": problem.model_dump()})
+        except Exception as e:
+            logger.error(f"Problem stream failed: {e}")
+            yield ndjson({"type": "error", "detail": "Problem generation failed"})
+        
+        await problem_bank.store(request.track, request.difficulty, problems)
+        yield ndjson({"type": "done", "count": len(problems), "diagnostics": parser.diagnostics})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+# Generation Jobs
+JOB_KINDS = {"roadmap": RoadmapRequest, "problems": ProblemRequest}
+
+async def run_roadmap_job(user_id: str, request: RoadmapRequest) -> Dict:
+    key, system_message, user_text = roadmap_prompt(request)
+    
+    async def generate():
+        return await llm_client.complete(f"roadmap_{key[:16]}", system_message, user_text)
+    
+    content = await llm_cache.get_or_generate(key, "roadmap", generate)
+    return {"roadmap_id": await save_roadmap(user_id, request, content), "content": content}
+
+async def run_problems_job(user_id: str, request: ProblemRequest) -> Dict:
+    return {"problems": await problem_bank.serve(request.track, request.difficulty, request.count, user_id)}
+
+JOB_RUNNERS = {"roadmap": run_roadmap_job, "problems": run_problems_job}
+
+class GenerationJobs:
+    """Mongo-backed LLM job queue, scheduled round-robin across users"""
+
+    def __init__(self, workers: int, max_attempts: int, retry_base: float):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        # user_id -> job ids; users take turns so one student cannot starve the rest
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()
+        self.ready = asyncio.Event()
+        # job id -> one event per waiting stream, dropped as each waiter returns
+        self.finished: Dict[str, set] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.stats = {"succeeded": 0, "failed": 0, "retried": 0}
+
+    def enqueue(self, user_id: str, job_id: str):
+        self.queues.setdefault(user_id, deque()).append(job_id)
+        self.ready.set()
+
+    def next_job(self) -> Optional[str]:
+        if not self.queues:
+            return None
+        user_id, jobs = self.queues.popitem(last=False)
+        job_id = jobs.popleft()
+        if jobs:
+            self.queues[user_id] = jobs
+        return job_id
+
+    async def submit(self, user_id: str, kind: str, payload: Dict) -> Dict:
+        pending = await db.generation_jobs.count_documents(
+            {"user_id": user_id, "status": {"$in": ["queued", "running"]}}
+        )
+        if pending >= JOB_MAX_PENDING_PER_USER:
+            raise HTTPException(status_code=429, detail="Too many generation jobs in progress")
+        
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "kind": kind,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await db.generation_jobs.insert_one(job)
+        job.pop('_id', None)
+        self.enqueue(user_id, job['id'])
+        return job
+
+    async def worker(self):
+        while True:
+            job_id = self.next_job()
+            if job_id is None:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            try:
+                await self.run(job_id)
+            except Exception as e:
+                logger.error(f"Generation job {job_id} crashed: {e}")
+
+    async def run(self, job_id: str):
+        # Atomic claim, so a job recovered by another process never runs twice
+        job = await db.generation_jobs.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "updated_at": datetime.now(timezone.utc)}, "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return
+        
+        heartbeat = asyncio.create_task(self.heartbeat(job))
+        try:
+            request = JOB_KINDS[job['kind']](**job['payload'])
+            result = await JOB_RUNNERS[job['kind']](job['user_id'], request)
+        except Exception as e:
+            await self.failed(job, e)
+            return
+        finally:
+            heartbeat.cancel()
+        
+        if await self.finish(job, {"status": "succeeded", "result": result, "error": None}):
+            self.stats['succeeded'] += 1
+            self.notify(job_id)
+
+    @staticmethod
+    def claim(job: Dict) -> Dict:
+        """Matches the job only while this run still owns it: once recover() has
+        requeued it (or a later attempt has claimed it) the writes below no-op"""
+        return {"id": job['id'], "status": "running", "attempts": job['attempts']}
+
+    async def heartbeat(self, job: Dict):
+        # Keeps a slow but live run (semaphore waits, sequential refills) from looking dead
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            result = await db.generation_jobs.update_one(
+                self.claim(job), {"$set": {"updated_at": datetime.now(timezone.utc)}}
+            )
+            if not result.matched_count:
+                return
+
+    async def finish(self, job: Dict, fields: Dict) -> bool:
+        result = await db.generation_jobs.update_one(
+            self.claim(job), {"$set": {**fields, "updated_at": datetime.now(timezone.utc)}}
+        )
+        if not result.modified_count:
+            logger.warning(f"Generation job {job['id']} attempt {job['attempts']} lost its claim; result dropped")
+            return False
+        return True
+
+    async def failed(self, job: Dict, error: Exception):
+        detail = error.detail if isinstance(error, HTTPException) else str(error) or type(error).__name__
+        if job['attempts'] < self.max_attempts:
+            if not await self.finish(job, {"status": "queued", "error": detail}):
+                return
+            self.stats['retried'] += 1
+            # Exponential backoff with jitter before the job becomes schedulable again
+            delay = self.retry_base * 2 ** (job['attempts'] - 1) * random.uniform(0.5, 1.5)
+            asyncio.get_running_loop().call_later(delay, self.enqueue, job['user_id'], job['id'])
+            return
+        
+        if await self.finish(job, {"status": "failed", "error": detail}):
+            self.stats['failed'] += 1
+            self.notify(job['id'])
+
+    def notify(self, job_id: str):
+        for event in self.finished.pop(job_id, ()):
+            event.set()
+
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        event = asyncio.Event()
+        waiters = self.finished.setdefault(job_id, set())
+        waiters.add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            # Jobs finished on another worker never notify here, so without this
+            # every timed-out or disconnected stream would leave its entry behind
+            waiters.discard(event)
+            if not waiters and self.finished.get(job_id) is waiters:
+                del self.finished[job_id]
+
+    async def recover(self):
+        """Requeue jobs whose worker died, i.e. stopped heartbeating"""
+        stale = datetime.now(timezone.utc) - timedelta(seconds=JOB_HEARTBEAT_SECONDS * 4)
+        async for job in db.generation_jobs.find(
+            {"status": "running", "updated_at": {"$lt": stale}}, {"_id": 0, "id": 1, "user_id": 1}
+        ):
+            result = await db.generation_jobs.update_one(
+                {"id": job['id'], "status": "running", "updated_at": {"$lt": stale}},
+                {"$set": {"status": "queued", "updated_at": datetime.now(timezone.utc)}}
+            )
+            if result.modified_count:
+                self.enqueue(job['user_id'], job['id'])
+
+    async def sweeper(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Generation job recovery failed: {e}")
+
+    async def start(self):
+        # Pick up work left queued by a previous run
+        async for job in db.generation_jobs.find(
+            {"status": "queued"}, {"_id": 0, "id": 1, "user_id": 1}
+        ).sort("created_at", 1):
+            self.enqueue(job['user_id'], job['id'])
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self.sweeper()))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": sum(len(jobs) for jobs in self.queues.values()),
+            "users_waiting": len(self.queues),
+            "streams_waiting": sum(len(waiters) for waiters in self.finished.values()),
+            **self.stats,
+        }
+
+generation_jobs = GenerationJobs(LLM_CONCURRENCY, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS)
+
+def public_job(job: Dict) -> Dict:
+    return {k: job.get(k) for k in ("id", "kind", "status", "attempts", "result", "error", "created_at", "updated_at")}
+
+async def get_owned_job(job_id: str, user_id: str) -> Dict:
+    job = await db.generation_jobs.find_one({"id": job_id, "user_id": user_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.post("/jobs/roadmap", status_code=202)
+async def submit_roadmap_job(request: RoadmapRequest, current_user: Dict = Depends(get_current_user)):
+    """Queue a roadmap generation and return its job id"""
+    job = await generation_jobs.submit(current_user['id'], "roadmap", request.model_dump())
+    return public_job(job)
+
+@api_router.post("/jobs/problems", status_code=202)
+async def submit_problems_job(request: ProblemRequest, current_user: Dict = Depends(get_current_user)):
+    """Queue a problem set request and return its job id"""
+    job = await generation_jobs.submit(current_user['id'], "problems", request.model_dump())
+    return public_job(job)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: Dict = Depends(get_current_user_claims)):
+    """Poll a generation job"""
+    return public_job(await get_owned_job(job_id, current_user['id']))
+
+@api_router.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str, request: Request, current_user: Dict = Depends(get_stream_user)):
+    """Server-Sent Events: heartbeats until the job finishes, then its final state"""
+    await get_owned_job(job_id, current_user['id'])
+    
+    async def events():
+        while not await request.is_disconnected():
+            job = await get_owned_job(job_id, current_user['id'])
+            if job['status'] in ("succeeded", "failed"):
+                yield f"event: {job['status']}\ndata: {dump_json(public_job(job))}\n\n"
+                return
+            # Another worker process may finish the job, so re-read on every wakeup
+            if not await generation_jobs.wait(job_id, NOTIFICATION_HEARTBEAT_SECONDS):
+                yield ": heartbeat\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Track/difficulty recorded for problems that are not (or no longer) in the bank
+UNKNOWN_PROGRESS_KEY = "unknown"
+
 @api_router.post("/problems/complete")
 async def complete_problem(data: ProblemComplete, current_user: Dict = Depends(get_current_user)):
     if current_user['id'] != data.user_id:
         raise HTTPException(status_code=401, detail="Access denied")
     
-    # Record completion
-    completion_record = {
-        "id": str(uuid.uuid4()),
-        "user_id": data.user_id,
-        "problem_id": data.problem_id,
-        "completed_at": datetime.now(timezone.utc).isoformat()
-    }
+    problem = await db.problem_bank.find_one(
+        {"id": data.problem_id}, {"_id": 0, "track": 1, "difficulty": 1}
+    ) or {}
+    # Never null: null keys cannot be rebuilt with $merge and read as "unknown" anyway
+    track = problem.get('track') or UNKNOWN_PROGRESS_KEY
+    difficulty = problem.get('difficulty') or UNKNOWN_PROGRESS_KEY
     
-    await db.problem_completions.insert_one(completion_record)
+    # Record completion once per (user, problem): retries and double-clicks are no-ops
+    try:
+        result = await db.problem_completions.update_one(
+            {"user_id": data.user_id, "problem_id": data.problem_id},
+            {"$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "track": track,
+                "difficulty": difficulty,
+                "completed_at": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+        newly_completed = result.upserted_id is not None
+    except DuplicateKeyError:
+        # A concurrent request for the same problem won the upsert
+        newly_completed = False
+    
+    # A crash between these two writes leaves the counter one low; the
+    # problem_progress migration rebuilds every counter from completions
+    if newly_completed:
+        await db.problem_progress.update_one(
+            {"user_id": data.user_id, "track": track, "difficulty": difficulty},
+            {"$inc": {"completed": 1}},
+            upsert=True
+        )
     
-    return {"message": "Problem marked as complete"}
+    return {"message": "Problem marked as complete", "already_completed": not newly_completed}
+
+@api_router.get("/progress/{user_id}")
+async def get_progress(user_id: str, current_user: Dict = Depends(get_current_user_claims)):
+    """Solved problem counts per track and difficulty, for yourself or a friend"""
+    if current_user['id'] != user_id and not await check_if_friends(current_user['id'], user_id):
+        raise HTTPException(status_code=401, detail="Access denied")
+    
+    # One counter document per (track, difficulty) the user has solved anything in
+    counters = await db.problem_progress.find({"user_id": user_id}, {"_id": 0}).to_list(None)
+    
+    tracks: Dict[str, Dict] = {}
+    by_difficulty: Dict[str, int] = {}
+    for counter in counters:
+        track = counter.get('track') or UNKNOWN_PROGRESS_KEY
+        difficulty = counter.get('difficulty') or UNKNOWN_PROGRESS_KEY
+        entry = tracks.setdefault(track, {"completed": 0, "by_difficulty": {}})
+        entry['completed'] += counter['completed']
+        entry['by_difficulty'][difficulty] = entry['by_difficulty'].get(difficulty, 0) + counter['completed']
+        by_difficulty[difficulty] = by_difficulty.get(difficulty, 0) + counter['completed']
+    
+    return {
+        "user_id": user_id,
+        "completed": sum(entry['completed'] for entry in tracks.values()),
+        "by_track": tracks,
+        "by_difficulty": by_difficulty,
+    }
 
 # Friend Request System
+class FriendGraph:
+    """Cached adjacency sets over the friendships collection.
+
+    Each user's friend ids are loaded with one indexed query and kept as a
+    frozenset, so membership tests are O(1). Writers invalidate both ends of
+    an edge; the TTL bounds how long other workers can serve a stale set,
+    which is why authorization checks use check_if_friends instead.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bumped on every invalidation so a load that raced a write is not cached
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def friends_many(self, user_ids) -> Dict[str, frozenset]:
+        """Adjacency sets for several users, loading all misses in one round trip"""
+        result = {}
+        missing = []
+        for user_id in set(user_ids):
+            friends = self.cache.get(user_id)
+            if friends is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = friends
+        self.hits += len(result)
+        if not missing:
+            return result
+        
+        self.misses += len(missing)
+        generation = self.generation
+        adjacency = {user_id: set() for user_id in missing}
+        async for edge in db.friendships.find({
+            "$or": [
+                {"user1_id": {"$in": missing}},
+                {"user2_id": {"$in": missing}}
+            ]
+        }, {"_id": 0, "user1_id": 1, "user2_id": 1}):
+            if edge['user1_id'] in adjacency:
+                adjacency[edge['user1_id']].add(edge['user2_id'])
+            if edge['user2_id'] in adjacency:
+                adjacency[edge['user2_id']].add(edge['user1_id'])
+        
+        for user_id, friends in adjacency.items():
+            result[user_id] = frozenset(friends)
+            if generation == self.generation:
+                self.cache[user_id] = result[user_id]
+        return result
+
+    async def friends(self, user_id: str) -> frozenset:
+        return (await self.friends_many([user_id]))[user_id]
+
+    async def are_friends(self, user1_id: str, user2_id: str) -> bool:
+        return user2_id in await self.friends(user1_id)
+
+    async def mutual(self, user1_id: str, user2_id: str) -> frozenset:
+        graph = await self.friends_many([user1_id, user2_id])
+        return graph[user1_id] & graph[user2_id]
+
+    async def suggestions(self, user_id: str) -> List[tuple]:
+        """Friends-of-friends as (user id, mutual friend count), most mutual first"""
+        friends = await self.friends(user_id)
+        if not friends:
+            return []
+        counts = Counter()
+        for friends_of_friend in (await self.friends_many(friends)).values():
+            counts.update(friends_of_friend)
+        for excluded in friends | {user_id}:
+            counts.pop(excluded, None)
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def invalidate(self, *user_ids: str):
+        self.generation += 1
+        for user_id in user_ids:
+            self.cache.pop(user_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "size": len(self.cache),
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+friend_graph = FriendGraph(FRIEND_GRAPH_CACHE_SIZE, FRIEND_GRAPH_TTL)
+
 async def check_if_friends(user1_id: str, user2_id: str) -> bool:
-    """Check if two users are friends"""
-    friendship = await db.friendships.find_one({
+    """Check if two users are friends, straight from the database.
+
+    This gates access (progress visibility, new friend requests), so it must
+    not see another worker's stale friend_graph entry; the pair lookup is a
+    single indexed point read either way round.
+    """
+    edge = await db.friendships.find_one({
         "$or": [
             {"user1_id": user1_id, "user2_id": user2_id},
             {"user1_id": user2_id, "user2_id": user1_id}
         ]
-    })
-    return friendship is not None
+    }, {"_id": 0, "user1_id": 1})
+    return edge is not None
 
 @api_router.post("/friends/request/{receiver_id}")
 async def send_friend_request(receiver_id: str, current_user: Dict = Depends(get_current_user)):
@@ -562,11 +2083,7 @@ async def send_friend_request(receiver_id: str, current_user: Dict = Depends(get
         receiver_id=receiver_id
     )
     
-    request_dict = friend_request.model_dump()
-    request_dict['created_at'] = request_dict['created_at'].isoformat()
-    request_dict['updated_at'] = request_dict['updated_at'].isoformat()
-    
-    await db.friend_requests.insert_one(request_dict)
+    await db.friend_requests.insert_one(friend_request.model_dump())
     
     # Create notification for receiver
     notification = Notification(
@@ -576,61 +2093,46 @@ async def send_friend_request(receiver_id: str, current_user: Dict = Depends(get
         message=f"{current_user['name']} sent you a friend request",
         link="/friends?tab=incoming"
     )
-    await db.notifications.insert_one(notification.model_dump())
+    await insert_notifications([notification])
     
     return {"message": "Friend request sent successfully", "request_id": friend_request.id}
 
-@api_router.get("/friends/requests/incoming")
-async def get_incoming_requests(current_user: Dict = Depends(get_current_user)):
-    """Get all incoming friend requests"""
-    requests = await db.friend_requests.find(
-        {"receiver_id": current_user['id'], "status": "pending"},
+async def list_pending_requests(own_field: str, other_field: str, other_key: str, user_id: str,
+                                page: Dict) -> Dict:
+    """Page through pending requests and attach the other party in one batched lookup"""
+    requests, next_cursor = await keyset_page(
+        db.friend_requests,
+        {own_field: user_id, "status": "pending"},
+        NEWEST_FIRST,
+        page['cursor'],
+        page['limit'],
         {"_id": 0}
-    ).to_list(1000)
+    )
     
-    # Get sender details for each request
+    users = await fetch_user_summaries([request[other_field] for request in requests])
     for request in requests:
-        sender = await db.users.find_one(
-            {"id": request['sender_id']},
-            {"_id": 0, "password_hash": 0}
-        )
-        if sender:
-            request['sender'] = {
-                "id": sender['id'],
-                "name": sender['name'],
-                "batch": sender.get('batch'),
-                "skill_level": sender.get('skill_level')
+        other = users.get(request[other_field])
+        if other:
+            request[other_key] = {
+                "id": other['id'],
+                "name": other['name'],
+                "batch": other.get('batch'),
+                "skill_level": other.get('skill_level')
             }
-        if isinstance(request.get('created_at'), str):
-            request['created_at'] = datetime.fromisoformat(request['created_at'])
     
-    return {"requests": requests}
+    return {"requests": requests, "next_cursor": next_cursor}
+
+@api_router.get("/friends/requests/incoming")
+async def get_incoming_requests(page: Dict = Depends(page_params),
+                                current_user: Dict = Depends(get_current_user_claims)):
+    """Get incoming friend requests, newest first"""
+    return json_response(await list_pending_requests("receiver_id", "sender_id", "sender", current_user['id'], page))
 
 @api_router.get("/friends/requests/outgoing")
-async def get_outgoing_requests(current_user: Dict = Depends(get_current_user)):
-    """Get all outgoing friend requests"""
-    requests = await db.friend_requests.find(
-        {"sender_id": current_user['id'], "status": "pending"},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    # Get receiver details for each request
-    for request in requests:
-        receiver = await db.users.find_one(
-            {"id": request['receiver_id']},
-            {"_id": 0, "password_hash": 0}
-        )
-        if receiver:
-            request['receiver'] = {
-                "id": receiver['id'],
-                "name": receiver['name'],
-                "batch": receiver.get('batch'),
-                "skill_level": receiver.get('skill_level')
-            }
-        if isinstance(request.get('created_at'), str):
-            request['created_at'] = datetime.fromisoformat(request['created_at'])
-    
-    return {"requests": requests}
+async def get_outgoing_requests(page: Dict = Depends(page_params),
+                                current_user: Dict = Depends(get_current_user_claims)):
+    """Get outgoing friend requests, newest first"""
+    return json_response(await list_pending_requests("sender_id", "receiver_id", "receiver", current_user['id'], page))
 
 @api_router.post("/friends/accept/{request_id}")
 async def accept_friend_request(request_id: str, current_user: Dict = Depends(get_current_user)):
@@ -650,7 +2152,7 @@ async def accept_friend_request(request_id: str, current_user: Dict = Depends(ge
     # Update request status
     await db.friend_requests.update_one(
         {"id": request_id},
-        {"$set": {"status": "accepted", "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": "accepted", "updated_at": datetime.now(timezone.utc)}}
     )
     
     # Create friendship
@@ -659,10 +2161,8 @@ async def accept_friend_request(request_id: str, current_user: Dict = Depends(ge
         user2_id=request['receiver_id']
     )
     
-    friendship_dict = friendship.model_dump()
-    friendship_dict['created_at'] = friendship_dict['created_at'].isoformat()
-    
-    await db.friendships.insert_one(friendship_dict)
+    await db.friendships.insert_one(friendship.model_dump())
+    friend_graph.invalidate(request['sender_id'], request['receiver_id'])
     
     # Create notification for sender
     notification = Notification(
@@ -672,7 +2172,7 @@ async def accept_friend_request(request_id: str, current_user: Dict = Depends(ge
         message=f"{current_user['name']} accepted your friend request",
         link="/friends"
     )
-    await db.notifications.insert_one(notification.model_dump())
+    await insert_notifications([notification])
     
     return {"message": "Friend request accepted", "friendship_id": friendship.id}
 
@@ -694,7 +2194,7 @@ async def reject_friend_request(request_id: str, current_user: Dict = Depends(ge
     # Update request status
     await db.friend_requests.update_one(
         {"id": request_id},
-        {"$set": {"status": "rejected", "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": "rejected", "updated_at": datetime.now(timezone.utc)}}
     )
     
     return {"message": "Friend request rejected"}
@@ -712,106 +2212,328 @@ async def remove_friend(friend_id: str, current_user: Dict = Depends(get_current
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Friendship not found")
+    friend_graph.invalidate(current_user['id'], friend_id)
     
     return {"message": "Friend removed successfully"}
 
+async def get_friend_ids(user_id: str) -> List[str]:
+    """Ids of every friend of a user, without loading their profiles"""
+    return list(await friend_graph.friends(user_id))
+
 @api_router.get("/friends/list")
-async def get_friends_list(current_user: Dict = Depends(get_current_user)):
-    """Get list of all friends"""
-    friendships = await db.friendships.find({
-        "$or": [
-            {"user1_id": current_user['id']},
-            {"user2_id": current_user['id']}
-        ]
-    }, {"_id": 0}).to_list(1000)
-    
-    friend_ids = []
-    for friendship in friendships:
-        if friendship['user1_id'] == current_user['id']:
-            friend_ids.append(friendship['user2_id'])
-        else:
-            friend_ids.append(friendship['user1_id'])
+async def get_friends_list(page: Dict = Depends(page_params),
+                           current_user: Dict = Depends(get_current_user_claims)):
+    """Get friends, ordered by name"""
+    friend_ids = await get_friend_ids(current_user['id'])
     
     # Get friend details with privacy - show full profile for friends
-    friends = []
+    friends, next_cursor = [], None
     if friend_ids:
-        friends = await db.users.find(
+        friends, next_cursor = await keyset_page(
+            db.users,
             {"id": {"$in": friend_ids}},
-            {"_id": 0, "password_hash": 0}
-        ).to_list(1000)
-        
-        for friend in friends:
-            if isinstance(friend.get('created_at'), str):
-                friend['created_at'] = datetime.fromisoformat(friend['created_at'])
+            BY_NAME,
+            page['cursor'],
+            page['limit'],
+            PUBLIC_USER_PROJECTION
+        )
     
-    return {"friends": friends}
+    return json_response({"friends": friends, "next_cursor": next_cursor})
+
+@api_router.get("/friends/mutual/{user_id}")
+async def get_mutual_friends(user_id: str, current_user: Dict = Depends(get_current_user_claims)):
+    """Friends shared with another user, ordered by name"""
+    mutual_ids = await friend_graph.mutual(current_user['id'], user_id)
+    users = await fetch_user_summaries(list(mutual_ids))
+    friends = sorted(users.values(), key=lambda user: (user['name'], user['id']))
+    return {"friends": friends, "count": len(mutual_ids)}
+
+@api_router.get("/friends/suggestions")
+async def get_friend_suggestions(batch: Optional[str] = None,
+                                 limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                                 current_user: Dict = Depends(get_current_user_claims)):
+    """Friends of friends, ranked by number of mutual friends, optionally within one batch"""
+    ranked = await friend_graph.suggestions(current_user['id'])
+    if not ranked:
+        return {"suggestions": []}
+    
+    # Batch is a profile field, so it is filtered in the same users round trip
+    query = {"id": {"$in": [user_id for user_id, _ in ranked]}}
+    if batch and batch != "All":
+        query["batch"] = batch
+    users = {
+        user['id']: user
+        for user in await db.users.find(query, USER_SUMMARY_PROJECTION).to_list(None)
+    }
+    
+    suggestions = [
+        {**users[user_id], "mutual_friends": count}
+        for user_id, count in ranked if user_id in users
+    ][:limit]
+    return {"suggestions": suggestions}
+
+async def friendship_statuses(user_id: str, other_ids: List[str]) -> Dict[str, Dict]:
+    """Status of `user_id` towards each of `other_ids`.
+
+    Friendship comes from the friend graph and pending requests in either
+    direction from one query; the two run concurrently.
+    """
+    others = list(dict.fromkeys(other_ids))
+    friends, pending = await asyncio.gather(
+        friend_graph.friends(user_id),
+        db.friend_requests.find({
+            "$or": [
+                {"sender_id": user_id, "status": "pending", "receiver_id": {"$in": others}},
+                {"receiver_id": user_id, "status": "pending", "sender_id": {"$in": others}}
+            ]
+        }, {"_id": 0, "id": 1, "sender_id": 1, "receiver_id": 1}).to_list(None)
+    )
+    
+    sent, received = {}, {}
+    for request in pending:
+        if request['sender_id'] == user_id:
+            sent[request['receiver_id']] = request['id']
+        else:
+            received[request['sender_id']] = request['id']
+    
+    statuses = {}
+    for other_id in others:
+        if other_id == user_id:
+            statuses[other_id] = {"status": "self"}
+        elif other_id in friends:
+            statuses[other_id] = {"status": "friends"}
+        elif other_id in sent:
+            statuses[other_id] = {"status": "request_sent", "request_id": sent[other_id]}
+        elif other_id in received:
+            statuses[other_id] = {"status": "request_received", "request_id": received[other_id]}
+        else:
+            statuses[other_id] = {"status": "none"}
+    return statuses
 
 @api_router.get("/friends/status/{user_id}")
-async def check_friendship_status(user_id: str, current_user: Dict = Depends(get_current_user)):
+async def check_friendship_status(user_id: str, current_user: Dict = Depends(get_current_user_claims)):
     """Check friendship status with a user"""
     if current_user['id'] == user_id:
         return {"status": "self"}
-    
-    # Check if friends
-    if await check_if_friends(current_user['id'], user_id):
-        return {"status": "friends"}
-    
-    # Check for pending request sent by current user
-    sent_request = await db.friend_requests.find_one({
-        "sender_id": current_user['id'],
-        "receiver_id": user_id,
-        "status": "pending"
-    })
-    
-    if sent_request:
-        return {"status": "request_sent", "request_id": sent_request['id']}
-    
-    # Check for pending request received by current user
-    received_request = await db.friend_requests.find_one({
-        "sender_id": user_id,
-        "receiver_id": current_user['id'],
-        "status": "pending"
-    })
-    
-    return {"status": "none"}
+    return (await friendship_statuses(current_user['id'], [user_id]))[user_id]
+
+@api_router.post("/friends/status")
+async def check_friendship_statuses(request: FriendshipStatusRequest,
+                                    current_user: Dict = Depends(get_current_user_claims)):
+    """Friendship status with every user in a list, e.g. one page of a roster"""
+    if len(request.user_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} user ids per request")
+    return {"statuses": await friendship_statuses(current_user['id'], request.user_ids)}
 
 
 # User search endpoints
 @api_router.get("/users")
-async def get_users(batch: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
-    """Get all users with optional batch filter"""
+async def get_users(batch: Optional[str] = None, page: Dict = Depends(page_params),
+                    current_user: Dict = Depends(get_current_user_claims)):
+    """Get users ordered by name, with optional batch filter"""
     query = {}
     if batch and batch != "All":
         query["batch"] = batch
     
-    users = await db.users.find(query, {"_id": 0, "password_hash": 0}).to_list(1000)
-    
-    # Convert created_at to datetime if needed
-    for user in users:
-        if isinstance(user.get('created_at'), str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
+    users, next_cursor = await keyset_page(
+        db.users, query, BY_NAME, page['cursor'], page['limit'], PUBLIC_USER_PROJECTION
+    )
     
-    return {"users": users}
+    return json_response({"users": users, "next_cursor": next_cursor})
+
+SEARCH_SORT = [("name_key", ASCENDING), ("id", ASCENDING)]
+
+async def search_user_page(q: str, cursor: Optional[str], limit: int, batch: Optional[str] = None):
+    """Ranked, indexed name search.
+
+    Tier 0 holds names that start with the whole query (a range scan on
+    name_key); tier 1 holds names where every query word prefixes some word
+    of the name (equality on name_tokens). The cursor records the tier plus
+    a keyset cursor inside it. A batch filter applies to both tiers, so pages
+    stay full instead of being thinned out client-side.
+    """
+    words = sorted({word[:SEARCH_PREFIX_MAX] for word in q.split()}, key=len, reverse=True)
+    whole_prefix = {"$gte": q, "$lt": q + "\uffff"}
+    tiers = [
+        {"name_key": whole_prefix},
+        {"name_tokens": {"$all": words}, "name_key": {"$not": whole_prefix}},
+    ]
+    if batch and batch != "All":
+        for tier_query in tiers:
+            tier_query["batch"] = batch
+    # Keep name_key: the keyset cursor is built from it
+    projection = {"_id": 0, "password_hash": 0, "name_tokens": 0, "email_lower": 0}
+    
+    tier, inner = 0, None
+    if cursor:
+        tier, inner = decode_cursor(cursor, 2)
+        if tier not in range(len(tiers)):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    users = []
+    for i in range(tier, len(tiers)):
+        docs, next_inner = await keyset_page(
+            db.users, tiers[i], SEARCH_SORT, inner if i == tier else None, limit - len(users), projection
+        )
+        users.extend(docs)
+        if next_inner:
+            return users, encode_cursor([i, next_inner])
+        if len(users) >= limit:
+            return users, encode_cursor([i + 1, None]) if i + 1 < len(tiers) else None
+    return users, None
 
 @api_router.get("/search/users")
-async def search_users(q: str, current_user: Dict = Depends(get_current_user)):
-    """Search users by name"""
-    users = await db.users.find(
-        {"name": {"$regex": q, "$options": "i"}},
-        {"_id": 0, "password_hash": 0}
-    ).to_list(100)
-    
-    # Convert created_at to datetime if needed
-    for user in users:
-        if isinstance(user.get('created_at'), str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
+async def search_users(q: str = Query(..., max_length=100), batch: Optional[str] = None,
+                       page: Dict = Depends(page_params),
+                       current_user: Dict = Depends(get_current_user_claims)):
+    """Search users by name prefix, with optional batch filter"""
+    query = normalize_name(q)
+    users, next_cursor = [], None
+    if query:
+        users, next_cursor = await search_user_page(query, page['cursor'], page['limit'], batch)
+        for user in users:
+            user.pop('name_key', None)
+    
+    # Echo the normalized query so a debounced client can drop stale responses
+    return json_response({"q": query, "users": users, "next_cursor": next_cursor})
+
+
+# Leaderboard
+LEADERBOARD_SORT = [("points", DESCENDING), ("id", ASCENDING)]
+LEADERBOARD_PROJECTION = {**USER_SUMMARY_PROJECTION, "points": 1}
+
+class Leaderboard:
+    """Competition ranks by points, overall and within each batch.
+
+    Each scope keeps its members' negated point totals in a sorted list, so a
+    user's rank is one bisect (1 + the number of strictly higher totals).
+    Writers call update() when points change; a periodic rebuild from the
+    users collection picks up changes made by other workers.
+    """
+
+    OVERALL = "All"
+
+    def __init__(self):
+        self.members: Dict[str, tuple] = {}  # user id -> (batch, points)
+        self.scopes: Dict[str, List[int]] = {}
+        self.loaded = False
+        self.rebuilding: Optional[Dict[str, tuple]] = None
+        self.rebuilds = 0
+        self.last_rebuild_ms = 0.0
+
+    def _scopes_of(self, batch: Optional[str]) -> tuple:
+        return (self.OVERALL, batch) if batch and batch != self.OVERALL else (self.OVERALL,)
+
+    def _apply(self, user_id: str, batch: Optional[str], points: int):
+        old = self.members.get(user_id)
+        if old == (batch, points):
+            return
+        if old is not None:
+            for scope in self._scopes_of(old[0]):
+                totals = self.scopes[scope]
+                del totals[bisect_left(totals, -old[1])]
+        self.members[user_id] = (batch, points)
+        for scope in self._scopes_of(batch):
+            insort(self.scopes.setdefault(scope, []), -points)
+
+    def update(self, user_id: str, batch: Optional[str], points: int):
+        self._apply(user_id, batch, points)
+        if self.rebuilding is not None:
+            # Replayed over the rebuilt tables, which may have read the old value
+            self.rebuilding[user_id] = (batch, points)
+
+    def rank(self, user_id: str, scope: str = OVERALL) -> Optional[Dict[str, Any]]:
+        member = self.members.get(user_id)
+        if member is None or scope not in self._scopes_of(member[0]):
+            return None
+        totals = self.scopes[scope]
+        return {"rank": bisect_left(totals, -member[1]) + 1, "points": member[1], "total": len(totals)}
+
+    async def rebuild(self):
+        start = time.perf_counter()
+        self.rebuilding = {}
+        try:
+            members, scopes = {}, {}
+            # Index order makes the final sorts near-linear
+            async for user in db.users.find({}, {"_id": 0, "id": 1, "batch": 1, "points": 1}).sort(LEADERBOARD_SORT):
+                batch, points = user.get('batch'), user.get('points', 0)
+                members[user['id']] = (batch, points)
+                for scope in self._scopes_of(batch):
+                    scopes.setdefault(scope, []).append(-points)
+            for totals in scopes.values():
+                totals.sort()
+            self.members, self.scopes = members, scopes
+            for user_id, (batch, points) in self.rebuilding.items():
+                self._apply(user_id, batch, points)
+        finally:
+            self.rebuilding = None
+        self.rebuilds += 1
+        self.last_rebuild_ms = (time.perf_counter() - start) * 1000
+        self.loaded = True
+
+    async def run(self):
+        while True:
+            try:
+                await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Leaderboard rebuild failed: {e}")
+            await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.members),
+            "scopes": {scope: len(totals) for scope, totals in self.scopes.items()},
+            "rebuilds": self.rebuilds,
+            "last_rebuild_ms": round(self.last_rebuild_ms, 1),
+        }
+
+leaderboard = Leaderboard()
+
+@api_router.get("/leaderboard")
+async def get_leaderboard(batch: Optional[str] = None,
+                          limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+                          current_user: Dict = Depends(get_current_user_claims)):
+    """Top users by points, overall or within one batch"""
+    query = {}
+    if batch and batch != Leaderboard.OVERALL:
+        query["batch"] = batch
     
-    return {"users": users}
+    # Read straight off the (batch,) points, id index
+    users = await db.users.find(query, LEADERBOARD_PROJECTION).sort(LEADERBOARD_SORT).limit(limit).to_list(limit)
+    
+    entries = []
+    for i, user in enumerate(users):
+        user['points'] = user.get('points', 0)
+        tied = entries and entries[-1]['points'] == user['points']
+        entries.append({"rank": entries[-1]['rank'] if tied else i + 1, **user})
+    
+    return json_response({"batch": batch or Leaderboard.OVERALL, "entries": entries})
+
+@api_router.get("/leaderboard/me")
+async def get_my_rank(current_user: Dict = Depends(get_current_user_claims)):
+    """The current user's rank overall and within their batch"""
+    if not leaderboard.loaded:
+        raise HTTPException(status_code=503, detail="Leaderboard is loading", headers={"Retry-After": "5"})
+    user_id = current_user['id']
+    if user_id not in leaderboard.members:
+        # Signed up on another worker since the last rebuild
+        user = await load_user(user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        leaderboard.update(user_id, user.get('batch'), user.get('points', 0))
+    batch = leaderboard.members[user_id][0]
+    return {
+        "overall": leaderboard.rank(user_id),
+        "batch": batch,
+        "batch_rank": leaderboard.rank(user_id, batch) if batch else None,
+    }
 
 
 # Notification Endpoints
 @api_router.get("/notifications/unread")
-async def get_unread_notifications(current_user: Dict = Depends(get_current_user)):
+async def get_unread_notifications(current_user: Dict = Depends(get_current_user_claims)):
     """Get all unread notifications"""
     notifications = await db.notifications.find(
         {"user_id": current_user['id'], "read": False},
@@ -820,117 +2542,378 @@ async def get_unread_notifications(current_user: Dict = Depends(get_current_user
     
     return {"notifications": notifications, "count": len(notifications)}
 
+@api_router.get("/notifications/unread/count")
+async def get_unread_count(current_user: Dict = Depends(get_current_user_claims)):
+    """Get the number of unread notifications"""
+    counter = await db.notification_counters.find_one(
+        {"user_id": current_user['id']},
+        {"_id": 0, "unread": 1}
+    )
+    return {"count": max(0, counter['unread']) if counter else 0}
+
+def format_notification_event(notification: Dict) -> str:
+    data = dump_json(notification)
+    return f"id: {notification['id']}\nevent: notification\ndata: {data}\n\n"
+
+async def missed_notifications(user_id: str, last_event_id: str) -> List[Dict]:
+    """Notifications created after the one a reconnecting client saw last"""
+    last = await db.notifications.find_one(
+        {"id": last_event_id, "user_id": user_id},
+        {"_id": 0, "created_at": 1}
+    )
+    if not last:
+        return []
+    return await db.notifications.find(
+        {"user_id": user_id, "created_at": {"$gt": last['created_at']}},
+        {"_id": 0}
+    ).sort("created_at", 1).to_list(NOTIFICATION_STREAM_QUEUE)
+
+@api_router.get("/notifications/stream")
+async def stream_notifications(request: Request, current_user: Dict = Depends(get_stream_user)):
+    """Push new notifications as Server-Sent Events"""
+    user_id = current_user['id']
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    # Subscribe before replaying so nothing published in between is lost
+    queue = notification_hub.subscribe(user_id)
+    
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            replayed = set()
+            if last_event_id:
+                for notification in await missed_notifications(user_id, last_event_id):
+                    replayed.add(notification['id'])
+                    yield format_notification_event(notification)
+            
+            while not await request.is_disconnected():
+                try:
+                    notification = await asyncio.wait_for(queue.get(), timeout=NOTIFICATION_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if notification is None:
+                    yield "event: overflow\ndata: {}\n\n"
+                    break
+                if notification['id'] not in replayed:
+                    yield format_notification_event(notification)
+        finally:
+            notification_hub.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.get("/notifications")
-async def get_notifications(current_user: Dict = Depends(get_current_user)):
-    """Get all notifications"""
-    notifications = await db.notifications.find(
+async def get_notifications(page: Dict = Depends(page_params),
+                            current_user: Dict = Depends(get_current_user_claims)):
+    """Get notifications, newest first"""
+    notifications, next_cursor = await keyset_page(
+        db.notifications,
         {"user_id": current_user['id']},
+        NEWEST_FIRST,
+        page['cursor'],
+        page['limit'],
         {"_id": 0}
-    ).sort("created_at", -1).to_list(50)
+    )
     
-    return {"notifications": notifications}
+    return json_response({"notifications": notifications, "next_cursor": next_cursor})
 
 @api_router.post("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: Dict = Depends(get_current_user)):
     """Mark a notification as read"""
-    result = await db.notifications.update_one(
+    previous = await db.notifications.find_one_and_update(
         {"id": notification_id, "user_id": current_user['id']},
-        {"$set": {"read": True}}
+        {"$set": {"read": True}},
+        projection={"_id": 0, "read": 1},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Notification not found")
     
+    if not previous.get('read'):
+        await adjust_unread_count(current_user['id'], -1)
+    
     return {"message": "Notification marked as read"}
 
 @api_router.post("/notifications/mark-all-read")
 async def mark_all_notifications_read(current_user: Dict = Depends(get_current_user)):
     """Mark all notifications as read"""
-    await db.notifications.update_many(
+    result = await db.notifications.update_many(
         {"user_id": current_user['id'], "read": False},
         {"$set": {"read": True}}
     )
+    await adjust_unread_count(current_user['id'], -result.modified_count)
     
     return {"message": "All notifications marked as read"}
 
 @api_router.delete("/notifications/{notification_id}")
 async def delete_notification(notification_id: str, current_user: Dict = Depends(get_current_user)):
     """Delete a notification"""
-    result = await db.notifications.delete_one(
-        {"id": notification_id, "user_id": current_user['id']}
+    deleted = await db.notifications.find_one_and_delete(
+        {"id": notification_id, "user_id": current_user['id']},
+        projection={"_id": 0, "read": 1}
     )
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Notification not found")
     
+    if not deleted.get('read'):
+        await adjust_unread_count(current_user['id'], -1)
+    
     return {"message": "Notification deleted"}
 
+async def notify_friends_of_track(event_key: str, user_id: str, user_name: str, track_name: str,
+                                  friend_ids: List[str]) -> int:
+    """Write one friend_track_completed notification per friend in a single bulk insert"""
+    notifications = [
+        Notification(
+            id=event_notification_id(event_key, friend_id),
+            user_id=friend_id,
+            type="friend_track_completed",
+            title="Friend Achievement",
+            message=f"{user_name} completed the {track_name} track!",
+            link=f"/profile?user_id={user_id}"
+        )
+        for friend_id in friend_ids
+    ]
+    return await insert_notifications(notifications)
+
 @api_router.post("/tracks/complete")
-async def complete_track(track_data: dict, current_user: Dict = Depends(get_current_user)):
+async def complete_track(track_data: dict, background_tasks: BackgroundTasks,
+                         current_user: Dict = Depends(get_current_user)):
     """Complete a track and notify friends"""
     track_name = track_data.get('track')
     if not track_name:
         raise HTTPException(status_code=400, detail="Track name required")
-        
+    
+    # Notification ids derive from (user, track, recipient): completing the same
+    # track again, or retrying a request that failed midway, only fills in the
+    # notifications that were not written yet.
+    event_key = f"track_completed:{current_user['id']}:{track_name}"
+    
     # Create notification for user
     user_notification = Notification(
+        id=event_notification_id(event_key, current_user['id']),
         user_id=current_user['id'],
         type="track_completed",
         title="Track Completed! 🏆",
         message=f"Congratulations on completing the {track_name} track!",
         link="/profile"
     )
-    await db.notifications.insert_one(user_notification.model_dump())
+    await insert_notifications([user_notification])
     
     # Notify friends
-    friends_list = await get_friends_list(current_user)
-    friends = friends_list.get('friends', [])
+    friend_ids = await get_friend_ids(current_user['id'])
+    args = (event_key, current_user['id'], current_user['name'], track_name, friend_ids)
+    if len(friend_ids) > FANOUT_INLINE_LIMIT:
+        background_tasks.add_task(notify_friends_of_track, *args)
+    else:
+        await notify_friends_of_track(*args)
     
-    for friend in friends:
-        friend_notification = Notification(
-            user_id=friend['id'],
-            type="friend_track_completed",
-            title="Friend Achievement",
-            message=f"{current_user['name']} completed the {track_name} track!",
-            link=f"/profile?user_id={current_user['id']}"
-        )
-        await db.notifications.insert_one(friend_notification.model_dump())
-        
     return {"message": "Track completion recorded"}
 
 
-    return {"message": "Track completion recorded"}
-
-
-# Email Helper
-def send_email(to_email: str, subject: str, body: str):
-    """Send an email using Gmail SMTP"""
-    sender_email = os.environ.get('MAIL_USERNAME')
-    sender_password = os.environ.get('MAIL_PASSWORD')
-    
-    if not sender_email or not sender_password:
-        print("WARNING: Email credentials not found. Printing to console instead.")
-        print(f"To: {to_email}\nSubject: {subject}\nBody: {body}")
-        return
-
-    try:
+# Email
+class SMTPSender:
+    """Blocking SMTP client that keeps one authenticated connection open between sends.
+
+    Only ever used from the mail queue's single worker thread.
+    """
+
+    def __init__(self):
+        self.username = os.environ.get('MAIL_USERNAME')
+        self.password = os.environ.get('MAIL_PASSWORD')
+        self.host = MAIL_HOST or 'smtp.gmail.com'
+        self.connection: Optional[smtplib.SMTP] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(MAIL_HOST or (self.username and self.password))
+
+    def connect(self):
+        connection = smtplib.SMTP(self.host, MAIL_PORT, timeout=30)
+        if MAIL_STARTTLS:
+            connection.starttls()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        self.connection = connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    def build(self, to_email: str, subject: str, body: str) -> MIMEMultipart:
         msg = MIMEMultipart()
-        msg['From'] = sender_email
+        msg['From'] = self.username or f"no-reply@{self.host}"
         msg['To'] = to_email
         msg['Subject'] = subject
         msg.attach(MIMEText(body, 'plain'))
-
-        # Connect to Gmail SMTP
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-            
-        print(f"Email sent successfully to {to_email}")
-    except Exception as e:
-        print(f"Failed to send email: {str(e)}")
-        # Fallback to console in case of error
-        print(f"To: {to_email}\nSubject: {subject}\nBody: {body}")
+        return msg
+
+    def send_batch(self, messages: List[Dict]) -> Dict[str, Optional[Exception]]:
+        """Send every message over the shared connection; returns id -> error (None on success)"""
+        results = {}
+        for message in messages:
+            if not self.configured:
+                print("WARNING: Email credentials not found. Printing to console instead.")
+                print(f"To: {message['to']}\nSubject: {message['subject']}\nBody: {message['body']}")
+                results[message['id']] = None
+                continue
+            msg = self.build(message['to'], message['subject'], message['body'])
+            try:
+                if self.connection is None:
+                    self.connect()
+                try:
+                    self.connection.send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # The server dropped the idle connection; reconnect once
+                    self.connection = None
+                    self.connect()
+                    self.connection.send_message(msg)
+                results[message['id']] = None
+            except Exception as e:
+                if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                    self.connection = None
+                results[message['id']] = e
+        return results
+
+def is_permanent_mail_error(error: Exception) -> bool:
+    """5xx replies about the message or recipient will not succeed on retry"""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # A configuration problem, not the message's fault
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+class MailQueue:
+    """Durable outbound mail queue (outbound_mail collection) drained by one background sender.
+
+    Messages go queued -> sending -> sent, or back to queued with exponential
+    backoff on transient failures, or to dead once an error is permanent or
+    MAIL_MAX_ATTEMPTS is exhausted.
+    """
+
+    def __init__(self, sender: SMTPSender):
+        self.sender = sender
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"sent": 0, "retried": 0, "dead": 0}
+
+    async def enqueue(self, to_email: str, subject: str, body: str) -> str:
+        now = datetime.now(timezone.utc)
+        message = {
+            "id": str(uuid.uuid4()),
+            "to": to_email,
+            "subject": subject,
+            "body": body,
+            "status": "queued",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "last_error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await db.outbound_mail.insert_one(message)
+        self.wakeup.set()
+        return message['id']
+
+    async def claim_batch(self) -> List[Dict]:
+        now = datetime.now(timezone.utc)
+        batch = []
+        while len(batch) < MAIL_BATCH_SIZE:
+            message = await db.outbound_mail.find_one_and_update(
+                {"$or": [
+                    {"status": "queued", "next_attempt_at": {"$lte": now}},
+                    # A sender that died mid-batch leaves its claim behind
+                    {"status": "sending", "lease_until": {"$lt": now}},
+                ]},
+                {"$set": {"status": "sending", "lease_until": now + timedelta(minutes=5), "updated_at": now},
+                 "$inc": {"attempts": 1}},
+                projection={"_id": 0},
+                sort=[("next_attempt_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            if message is None:
+                break
+            batch.append(message)
+        return batch
+
+    async def record(self, batch: List[Dict], results: Dict[str, Optional[Exception]]):
+        now = datetime.now(timezone.utc)
+        ops = []
+        for message in batch:
+            error = results.get(message['id'])
+            if error is None:
+                update = {"status": "sent", "sent_at": now, "last_error": None}
+                self.stats['sent'] += 1
+            elif is_permanent_mail_error(error) or message['attempts'] >= MAIL_MAX_ATTEMPTS:
+                update = {"status": "dead", "last_error": str(error)}
+                self.stats['dead'] += 1
+                logger.error(f"Mail {message['id']} to {message['to']} dead-lettered: {error}")
+            else:
+                delay = MAIL_RETRY_BASE_SECONDS * 2 ** (message['attempts'] - 1)
+                update = {"status": "queued", "last_error": str(error),
+                          "next_attempt_at": now + timedelta(seconds=delay)}
+                self.stats['retried'] += 1
+            ops.append(UpdateOne({"id": message['id']}, {"$set": {**update, "updated_at": now}}))
+        if ops:
+            await db.outbound_mail.bulk_write(ops, ordered=False)
+
+    async def next_due_in(self) -> float:
+        message = await db.outbound_mail.find_one(
+            {"status": "queued"}, {"_id": 0, "next_attempt_at": 1}, sort=[("next_attempt_at", ASCENDING)]
+        )
+        if message is None:
+            return MAIL_IDLE_SECONDS
+        due = (message['next_attempt_at'] - datetime.now(timezone.utc)).total_seconds()
+        return max(0.0, min(MAIL_IDLE_SECONDS, due))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                batch = await self.claim_batch()
+                if batch:
+                    results = await loop.run_in_executor(self.executor, self.sender.send_batch, batch)
+                    await self.record(batch, results)
+                    continue
+                
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), await self.next_due_in())
+                except asyncio.TimeoutError:
+                    # Nothing to send for a while: let the connection go
+                    await loop.run_in_executor(self.executor, self.sender.close)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mail queue iteration failed: {e}")
+                await asyncio.sleep(5)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.submit(self.sender.close)
+        self.executor.shutdown(wait=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"connected": self.sender.connection is not None, **self.stats}
+
+mail_queue = MailQueue(SMTPSender())
 
 
 # Password Recovery Endpoints
@@ -938,13 +2921,7 @@ def send_email(to_email: str, subject: str, body: str):
 async def forgot_password(request: ForgotPasswordRequest):
     """Request a password reset or magic link"""
     # Case insensitive lookup
-    email_lower = request.email.lower()
-    
-    # Try to find user with case-insensitive regex if exact match fails
-    user = await db.users.find_one({"email": email_lower})
-    if not user:
-        # Try finding with case-insensitive regex
-        user = await db.users.find_one({"email": {"$regex": f"^{email_lower}$", "$options": "i"}})
+    user = await find_user_by_email(request.email, {"_id": 0, "email": 1})
     
     if not user:
         # Don't reveal if user exists
@@ -959,7 +2936,7 @@ async def forgot_password(request: ForgotPasswordRequest):
     
     reset_token = PasswordResetToken(
         email=user_email,
-        token=token,
+        token_hash=hash_reset_token(token),
         type="reset", # Can be used for both reset and magic link
         expires_at=expires_at
     )
@@ -970,65 +2947,72 @@ async def forgot_password(request: ForgotPasswordRequest):
     subject = "NSTrack Login Code"
     body = f"Your login/recovery code is: {token}\n\nThis code expires in 15 minutes."
     
-    # Run in thread pool to not block async loop
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, send_email, user_email, subject, body)
+    # Delivered by the background mail queue
+    await mail_queue.enqueue(user_email, subject, body)
     
     return {"message": "If an account exists, a recovery code has been sent."}
 
 @api_router.post("/auth/reset-password")
 async def reset_password(request: ResetPasswordRequest):
     """Reset password using token"""
-    reset_token = await db.password_resets.find_one({
-        "token": request.token,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
-    })
+    reset_token = await consume_reset_token(request.token)
     
     if not reset_token:
         raise HTTPException(status_code=400, detail="Invalid or expired code")
         
     # Hash new password
-    password_hash = hash_password(request.new_password)
+    password_hash = await hash_password_async(request.new_password)
     
     # Update user password
-    await db.users.update_one(
-        {"email": reset_token['email']},
-        {"$set": {"password_hash": password_hash}}
-    )
-    
-    # Delete used token
-    await db.password_resets.delete_one({"token": request.token})
+    user = await find_user_by_email(reset_token['email'], {"_id": 0, "id": 1})
+    if user:
+        await db.users.update_one({"id": user['id']}, {"$set": {"password_hash": password_hash}})
+        invalidate_user(user['id'])
     
     return {"message": "Password successfully reset"}
 
 @api_router.post("/auth/magic-login")
 async def magic_login(request: MagicLoginRequest):
     """Login using magic link token"""
-    reset_token = await db.password_resets.find_one({
-        "token": request.token,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
-    })
+    reset_token = await consume_reset_token(request.token)
     
     if not reset_token:
         raise HTTPException(status_code=400, detail="Invalid or expired code")
         
     # Get user
-    user = await db.users.find_one({"email": reset_token['email']})
+    user = await find_user_by_email(reset_token['email'], USER_RESPONSE_PROJECTION)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-        
-    # Create access token
-    access_token = create_access_token(data={"sub": user['id']})
-    
-    # Delete used token
-    await db.password_resets.delete_one({"token": request.token})
-    
-    # Convert _id to string for response
-    user_response = User(**user)
     
-    return TokenResponse(access_token=access_token, user=user_response)
-
-
+    return token_response(user)
+
+
+
+# Metrics Endpoints
+async def require_metrics_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """Metrics expose queue depths and cache contents, so they are not public"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+@api_router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    """Get runtime metrics for worker pools"""
+    return {
+        "hashing": hash_pool.snapshot(),
+        "user_cache": {"size": len(user_cache), "maxsize": user_cache.maxsize, **user_cache_stats},
+        "friend_graph": friend_graph.snapshot(),
+        "leaderboard": leaderboard.snapshot(),
+        "notification_stream": notification_hub.snapshot(),
+        "llm_cache": llm_cache.snapshot(),
+        "problem_bank": problem_bank.snapshot(),
+        "llm": llm_client.snapshot(),
+        "generation_jobs": generation_jobs.snapshot(),
+        "mail": mail_queue.snapshot(),
+    }
 
 
 # Include the router in the main app
@@ -1049,6 +3033,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_notification_watcher():
+    if NOTIFICATION_CHANGE_STREAMS:
+        app.state.notification_watcher = asyncio.create_task(watch_notifications())
+
+@app.on_event("startup")
+async def start_unread_reconciler():
+    app.state.unread_reconciler = asyncio.create_task(run_unread_reconciler())
+
+@app.on_event("startup")
+async def start_leaderboard():
+    app.state.leaderboard = asyncio.create_task(leaderboard.run())
+
+@app.on_event("startup")
+async def start_generation_workers():
+    await generation_jobs.start()
+
+@app.on_event("startup")
+async def start_mail_queue():
+    mail_queue.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    generation_jobs.stop()
+    mail_queue.stop()
+    for name in ('notification_watcher', 'unread_reconciler', 'leaderboard'):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    client.close()
+    hash_pool.executor.shutdown(wait=False)
\ No newline at end of file
@@ -12,15 +12,27 @@ const NotificationBell = () => {
     const [unreadCount, setUnreadCount] = useState(0);
     const [isOpen, setIsOpen] = useState(false);
     const [loading, setLoading] = useState(false);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const dropdownRef = useRef(null);
     const navigate = useNavigate();
     const { theme } = useTheme();
 
     useEffect(() => {
         fetchUnreadCount();
-        // Poll for notifications every 30 seconds
-        const interval = setInterval(fetchUnreadCount, 30000);
-        return () => clearInterval(interval);
+        const unsubscribe = notificationsApi.subscribeToNotifications((notification) => {
+            setUnreadCount(prev => prev + 1);
+            setNotifications(prev => [notification, ...prev]);
+        });
+        // Push only reaches us from the worker we are connected to unless the server
+        // runs change streams, so keep a slower poll to pick up the rest
+        const interval = setInterval(fetchUnreadCount, unsubscribe ? 60000 : 30000);
+        return () => {
+            clearInterval(interval);
+            if (unsubscribe) {
+                unsubscribe();
+            }
+        };
     }, []);
 
     useEffect(() => {
@@ -36,7 +48,7 @@ const NotificationBell = () => {
 
     const fetchUnreadCount = async () => {
         try {
-            const data = await notificationsApi.getUnreadNotifications();
+            const data = await notificationsApi.getUnreadCount();
             setUnreadCount(data.count);
         } catch (error) {
             console.error('Error fetching notifications:', error);
@@ -48,6 +60,7 @@ const NotificationBell = () => {
             setLoading(true);
             const data = await notificationsApi.getAllNotifications();
             setNotifications(data.notifications || []);
+            setNextCursor(data.next_cursor || null);
         } catch (error) {
             console.error('Error fetching notifications:', error);
         } finally {
@@ -55,6 +68,24 @@ const NotificationBell = () => {
         }
     };
 
+    const handleLoadMore = async (e) => {
+        e.stopPropagation();
+        try {
+            setLoadingMore(true);
+            const data = await notificationsApi.getAllNotifications(nextCursor);
+            // Pushed notifications may already be in the list
+            setNotifications(prev => {
+                const seen = new Set(prev.map(n => n.id));
+                return [...prev, ...(data.notifications || []).filter(n => !seen.has(n.id))];
+            });
+            setNextCursor(data.next_cursor || null);
+        } catch (error) {
+            toast.error('Failed to load notifications');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleToggle = () => {
         if (!isOpen) {
             fetchNotifications();
@@ -211,6 +242,19 @@ const NotificationBell = () => {
                                         </div>
                                     </div>
                                 ))}
+                                {nextCursor && (
+                                    <div className="p-3 text-center">
+                                        <Button
+                                            variant="ghost"
+                                            size="sm"
+                                            onClick={handleLoadMore}
+                                            disabled={loadingMore}
+                                            className="text-xs h-8 text-cyan-500 hover:text-cyan-400"
+                                        >
+                                            {loadingMore ? 'Loading...' : 'Load more'}
+                                        </Button>
+                                    </div>
+                                )}
                             </div>
                         )}
                     </ScrollArea>
@@ -1,7 +1,5 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import axios from 'axios';
-import { API } from '../App';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '../components/ui/select';
@@ -18,14 +16,21 @@ const FriendsPage = () => {
     const [activeTab, setActiveTab] = useState('friends'); // friends, incoming, outgoing, search
     const [loading, setLoading] = useState(true);
 
-    // Friends data
+    // Friends data, one page at a time; a non-null cursor means more pages exist
     const [friends, setFriends] = useState([]);
     const [incomingRequests, setIncomingRequests] = useState([]);
     const [outgoingRequests, setOutgoingRequests] = useState([]);
+    const [friendsCursor, setFriendsCursor] = useState(null);
+    const [incomingCursor, setIncomingCursor] = useState(null);
+    const [outgoingCursor, setOutgoingCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(null); // which list is fetching its next page
 
     // Search
     const [searchQuery, setSearchQuery] = useState('');
     const [searchResults, setSearchResults] = useState([]);
+    const [searchStatuses, setSearchStatuses] = useState({});
+    const [searchCursor, setSearchCursor] = useState(null);
+    const [lastSearch, setLastSearch] = useState(null); // query and batch the cursor belongs to
     const [selectedBatch, setSelectedBatch] = useState('All');
     const [searchLoading, setSearchLoading] = useState(false);
 
@@ -48,55 +53,61 @@ const FriendsPage = () => {
         }
     };
 
-    const fetchFriends = async () => {
+    // Without a cursor these reload the first page; with one they append the next page
+    const fetchFriends = async (cursor = null) => {
         try {
-            const data = await friendsApi.getFriendsList();
-            setFriends(data.friends || []);
+            const data = await friendsApi.getFriendsList(cursor);
+            setFriends(prev => cursor ? [...prev, ...(data.friends || [])] : data.friends || []);
+            setFriendsCursor(data.next_cursor || null);
         } catch (error) {
             console.error('Error fetching friends:', error);
             toast.error('Failed to load friends');
         }
     };
 
-    const fetchIncomingRequests = async () => {
+    const fetchIncomingRequests = async (cursor = null) => {
         try {
-            const data = await friendsApi.getIncomingRequests();
-            setIncomingRequests(data.requests || []);
+            const data = await friendsApi.getIncomingRequests(cursor);
+            setIncomingRequests(prev => cursor ? [...prev, ...(data.requests || [])] : data.requests || []);
+            setIncomingCursor(data.next_cursor || null);
         } catch (error) {
             console.error('Error fetching incoming requests:', error);
         }
     };
 
-    const fetchOutgoingRequests = async () => {
+    const fetchOutgoingRequests = async (cursor = null) => {
         try {
-            const data = await friendsApi.getOutgoingRequests();
-            setOutgoingRequests(data.requests || []);
+            const data = await friendsApi.getOutgoingRequests(cursor);
+            setOutgoingRequests(prev => cursor ? [...prev, ...(data.requests || [])] : data.requests || []);
+            setOutgoingCursor(data.next_cursor || null);
         } catch (error) {
             console.error('Error fetching outgoing requests:', error);
         }
     };
 
-    const handleSearch = async () => {
-        if (!searchQuery.trim()) {
+    const handleSearch = async (cursor = null) => {
+        // Later pages continue the submitted search, not whatever is typed now
+        const search = cursor ? lastSearch : { query: searchQuery, batch: selectedBatch };
+        if (!search.query.trim()) {
             toast.info('Please enter a name to search');
             return;
         }
 
         try {
             setSearchLoading(true);
-            const token = localStorage.getItem('token');
-            const response = await axios.get(`${API}/search/users?q=${searchQuery}`, {
-                headers: { Authorization: `Bearer ${token}` }
-            });
+            const data = await friendsApi.searchUsers(search.query, search.batch, cursor);
+            const results = data.users || [];
 
-            let results = response.data.users || [];
+            // Friend/request state comes from the server for just this page: the
+            // locally loaded friend and request lists may be partial
+            const statuses = results.length
+                ? await friendsApi.checkFriendshipStatuses(results.map(u => u.id))
+                : {};
 
-            // Filter by batch if selected
-            if (selectedBatch !== 'All') {
-                results = results.filter(u => u.batch === selectedBatch);
-            }
-
-            setSearchResults(results);
+            setSearchResults(prev => cursor ? [...prev, ...results] : results);
+            setSearchStatuses(prev => cursor ? { ...prev, ...statuses } : statuses);
+            setSearchCursor(data.next_cursor || null);
+            setLastSearch(search);
             setActiveTab('search');
         } catch (error) {
             console.error('Error searching users:', error);
@@ -106,12 +117,20 @@ const FriendsPage = () => {
         }
     };
 
+    const loadMore = async (list, fetchPage, cursor) => {
+        try {
+            setLoadingMore(list);
+            await fetchPage(cursor);
+        } finally {
+            setLoadingMore(null);
+        }
+    };
+
     const handleSendRequest = async (userId) => {
         try {
             await friendsApi.sendFriendRequest(userId);
             toast.success('Friend request sent!');
-            // Refresh search results to update button state
-            handleSearch();
+            setSearchStatuses(prev => ({ ...prev, [userId]: { status: 'request_sent' } }));
             fetchOutgoingRequests();
         } catch (error) {
             toast.error(error.response?.data?.detail || 'Failed to send request');
@@ -130,7 +149,7 @@ const FriendsPage = () => {
     const handleRejectRequest = async (requestId) => {
         try {
             await friendsApi.rejectRequest(requestId);
-            fetchIncomingRequests();
+            setIncomingRequests(prev => prev.filter(r => r.id !== requestId));
         } catch (error) {
             toast.error('Failed to reject request');
         }
@@ -139,28 +158,40 @@ const FriendsPage = () => {
     const handleRemoveFriend = async (friendId) => {
         try {
             await friendsApi.removeFriend(friendId);
-            fetchFriends();
+            setFriends(prev => prev.filter(f => f.id !== friendId));
         } catch (error) {
             toast.error('Failed to remove friend');
         }
     };
 
     const checkUserStatus = (userId) => {
-        // Check if already friends
-        if (friends.some(f => f.id === userId)) {
-            return 'friends';
+        switch (searchStatuses[userId]?.status) {
+            case 'friends':
+                return 'friends';
+            case 'request_sent':
+                return 'pending';
+            case 'request_received':
+                return 'received';
+            case 'self':
+                return 'self';
+            default:
+                return 'none';
         }
-        // Check if request sent
-        if (outgoingRequests.some(r => r.receiver?.id === userId)) {
-            return 'pending';
-        }
-        // Check if request received
-        if (incomingRequests.some(r => r.sender?.id === userId)) {
-            return 'received';
-        }
-        return 'none';
     };
 
+    const renderLoadMore = (list, fetchPage, cursor) => cursor && (
+        <div className="flex justify-center mt-6">
+            <Button
+                onClick={() => loadMore(list, fetchPage, cursor)}
+                disabled={loadingMore === list}
+                variant="ghost"
+                className={theme === 'dark' ? 'text-cyan-400' : 'text-blue-600'}
+            >
+                {loadingMore === list ? 'Loading...' : 'Load more'}
+            </Button>
+        </div>
+    );
+
     if (loading) {
         return (
             <div className={`min-h-screen flex items-center justify-center ${theme === 'dark' ? 'bg-black' : 'bg-white'
@@ -212,7 +243,7 @@ const FriendsPage = () => {
                                     />
                                 </div>
                                 <Button
-                                    onClick={handleSearch}
+                                    onClick={() => handleSearch()}
                                     disabled={searchLoading}
                                     className="bg-gradient-to-r from-cyan-500 to-blue-600 hover:from-cyan-600 hover:to-blue-700 text-white"
                                 >
@@ -260,7 +291,7 @@ const FriendsPage = () => {
                         }
                     >
                         <Heart className="w-4 h-4 mr-2" />
-                        Friends ({friends.length})
+                        Friends ({friends.length}{friendsCursor ? '+' : ''})
                     </Button>
                     <Button
                         onClick={() => setActiveTab('incoming')}
@@ -271,7 +302,7 @@ const FriendsPage = () => {
                         }
                     >
                         <Inbox className="w-4 h-4 mr-2" />
-                        Requests ({incomingRequests.length})
+                        Requests ({incomingRequests.length}{incomingCursor ? '+' : ''})
                     </Button>
                     <Button
                         onClick={() => setActiveTab('outgoing')}
@@ -282,7 +313,7 @@ const FriendsPage = () => {
                         }
                     >
                         <Send className="w-4 h-4 mr-2" />
-                        Sent ({outgoingRequests.length})
+                        Sent ({outgoingRequests.length}{outgoingCursor ? '+' : ''})
                     </Button>
                 </div>
 
@@ -314,6 +345,7 @@ const FriendsPage = () => {
                                 ))}
                             </div>
                         )}
+                        {renderLoadMore('friends', fetchFriends, friendsCursor)}
                     </div>
                 )}
 
@@ -345,6 +377,7 @@ const FriendsPage = () => {
                                 ))}
                             </div>
                         )}
+                        {renderLoadMore('incoming', fetchIncomingRequests, incomingCursor)}
                     </div>
                 )}
 
@@ -403,6 +436,7 @@ const FriendsPage = () => {
                                 ))}
                             </div>
                         )}
+                        {renderLoadMore('outgoing', fetchOutgoingRequests, outgoingCursor)}
                     </div>
                 )}
 
@@ -486,6 +520,7 @@ const FriendsPage = () => {
                                 })}
                             </div>
                         )}
+                        {renderLoadMore('search', handleSearch, searchCursor)}
                     </div>
                 )}
             </div>
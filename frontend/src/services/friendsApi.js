@@ -10,18 +10,19 @@ export const sendFriendRequest = async (receiverId) => {
     return response.data;
 };
 
-export const getIncomingRequests = async () => {
+// List endpoints return one page plus `next_cursor`; pass it back for the next page
+export const getIncomingRequests = async (cursor = null) => {
     const response = await axios.get(
         `${API}/friends/requests/incoming`,
-        { headers: getAuthHeaders() }
+        { headers: getAuthHeaders(), params: { cursor } }
     );
     return response.data;
 };
 
-export const getOutgoingRequests = async () => {
+export const getOutgoingRequests = async (cursor = null) => {
     const response = await axios.get(
         `${API}/friends/requests/outgoing`,
-        { headers: getAuthHeaders() }
+        { headers: getAuthHeaders(), params: { cursor } }
     );
     return response.data;
 };
@@ -44,10 +45,10 @@ export const rejectRequest = async (requestId) => {
     return response.data;
 };
 
-export const getFriendsList = async () => {
+export const getFriendsList = async (cursor = null) => {
     const response = await axios.get(
         `${API}/friends/list`,
-        { headers: getAuthHeaders() }
+        { headers: getAuthHeaders(), params: { cursor } }
     );
     return response.data;
 };
@@ -67,3 +68,25 @@ export const checkFriendshipStatus = async (userId) => {
     );
     return response.data;
 };
+
+// Statuses for a whole list of users in one request, keyed by user id
+export const checkFriendshipStatuses = async (userIds) => {
+    const response = await axios.post(
+        `${API}/friends/status`,
+        { user_ids: userIds },
+        { headers: getAuthHeaders() }
+    );
+    return response.data.statuses;
+};
+
+// One page of name search results, filtered by batch on the server
+export const searchUsers = async (query, batch = 'All', cursor = null) => {
+    const response = await axios.get(
+        `${API}/search/users`,
+        {
+            headers: getAuthHeaders(),
+            params: { q: query, batch: batch === 'All' ? null : batch, cursor }
+        }
+    );
+    return response.data;
+};
@@ -9,14 +9,23 @@ export const getUnreadNotifications = async () => {
     return response.data;
 };
 
-export const getAllNotifications = async () => {
+export const getUnreadCount = async () => {
     const response = await axios.get(
-        `${API}/notifications`,
+        `${API}/notifications/unread/count`,
         { headers: getAuthHeaders() }
     );
     return response.data;
 };
 
+// One page, newest first; pass `next_cursor` back to get the next one
+export const getAllNotifications = async (cursor = null) => {
+    const response = await axios.get(
+        `${API}/notifications`,
+        { headers: getAuthHeaders(), params: { cursor } }
+    );
+    return response.data;
+};
+
 export const markAsRead = async (notificationId) => {
     const response = await axios.post(
         `${API}/notifications/${notificationId}/read`,
@@ -42,3 +51,21 @@ export const deleteNotification = async (notificationId) => {
     );
     return response.data;
 };
+
+
+// Push channel: EventSource cannot send headers, so the token goes in the query
+// string. The browser reconnects on its own and resumes from Last-Event-ID.
+export const subscribeToNotifications = (onNotification) => {
+    const token = localStorage.getItem('token');
+    if (!token || typeof EventSource === 'undefined') {
+        return null;
+    }
+
+    const source = new EventSource(
+        `${API}/notifications/stream?token=${encodeURIComponent(token)}`
+    );
+    source.addEventListener('notification', (event) => {
+        onNotification(JSON.parse(event.data));
+    });
+    return () => source.close();
+};
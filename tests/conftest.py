@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# The backend is a flat directory of modules (server.py, build_indexes.py, ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# Importing server only creates a lazy Mongo client; point it at a scratch database
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("TEST_DB_NAME", "nstrack_test")
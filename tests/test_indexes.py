@@ -0,0 +1,40 @@
+"""Every hot query in build_indexes.HOT_QUERIES must be served by an index.
+
+Needs a reachable mongod (MONGO_URL, default localhost) and the backend
+dependencies; skipped otherwise. Runs against the TEST_DB_NAME scratch database.
+"""
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("motor")
+pymongo = pytest.importorskip("pymongo")
+
+
+def mongod_reachable() -> bool:
+    probe = pymongo.MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=1000)
+    try:
+        probe.admin.command("ping")
+        return True
+    except pymongo.errors.PyMongoError:
+        return False
+    finally:
+        probe.close()
+
+
+pytestmark = pytest.mark.skipif(not mongod_reachable(), reason="no mongod reachable at MONGO_URL")
+
+
+def test_hot_queries_use_indexes():
+    build_indexes = pytest.importorskip("build_indexes")
+
+    async def scanning_queries():
+        await build_indexes.build()
+        return [
+            (collection, query)
+            for collection, query, sort in build_indexes.HOT_QUERIES
+            if await build_indexes.uses_collscan(collection, query, sort)
+        ]
+
+    assert asyncio.run(scanning_queries()) == []
@@ -0,0 +1,108 @@
+"""ProblemParser: field handling, diagnostics, and invariance under arbitrary chunking."""
+import random
+
+import pytest
+
+server = pytest.importorskip("server")
+ProblemParser = server.ProblemParser
+from benchmarks.problem_parser import make_response  # noqa: E402
+
+
+def parse(text, chunks=None):
+    parser = ProblemParser("python", "easy")
+    problems = []
+    for chunk in chunks if chunks is not None else [text]:
+        problems += parser.feed(chunk)
+    problems += parser.close()
+    return [problem.model_dump(exclude={"id"}) for problem in problems], parser.diagnostics
+
+
+def codes(diagnostics):
+    return [diagnostic['code'] for diagnostic in diagnostics]
+
+
+def test_single_problem():
+    problems, diagnostics = parse(
+        "---\nTITLE: Two Sum\nDESCRIPTION: Find two numbers.\nHINTS: hash map | one pass\nSOLUTION: Use a dict.\n---\n"
+    )
+    assert problems == [{
+        "track": "python",
+        "difficulty": "easy",
+        "title": "Two Sum",
+        "description": "Find two numbers.",
+        "hints": ["hash map", "one pass"],
+        "solution_approach": "Use a dict.",
+    }]
+    assert diagnostics == []
+
+
+def test_multi_line_fields():
+    problems, _ = parse(
+        "TITLE: Windows\nDESCRIPTION: First line.\nSecond line.\n\nThird line.\n"
+        "HINTS: a | b\nSOLUTION: Step one.\nStep two.\n"
+    )
+    assert problems[0]['description'] == "First line.\nSecond line.\n\nThird line."
+    assert problems[0]['solution_approach'] == "Step one.\nStep two."
+
+
+def test_bullet_hints():
+    problems, _ = parse(
+        "TITLE: Heaps\nDESCRIPTION: d\nHINTS:\n- use a heap\n* pop the smallest\n1. stop at k\nSOLUTION: s\n"
+    )
+    assert problems[0]['hints'] == ["use a heap", "pop the smallest", "stop at k"]
+
+
+def test_markdown_bold_keys():
+    problems, diagnostics = parse("**TITLE:** Bold\n**DESCRIPTION:** d\n**HINTS:** h1 | h2\n**SOLUTION:** s\n")
+    assert problems[0]['title'] == "Bold"
+    assert problems[0]['hints'] == ["h1", "h2"]
+    assert diagnostics == []
+
+
+def test_defaults_for_missing_hints_and_solution():
+    problems, _ = parse("TITLE: Bare\nDESCRIPTION: d\n")
+    assert problems[0]['hints'] == ["Think about the problem step by step"]
+    assert problems[0]['solution_approach'] == "Break down the problem into smaller parts"
+
+
+@pytest.mark.parametrize("text, code, titles", [
+    ("TITLE: A\nDESCRIPTION: d\nTITLE: B\nDESCRIPTION: d\n", "missing_separator", ["A", "B"]),
+    ("TITLE: A\nDESCRIPTION: one\nDESCRIPTION: two\n", "duplicate_field", ["A"]),
+    ("Here are your problems:\n---\nTITLE: A\nDESCRIPTION: d\n---\n", "stray_text", ["A"]),
+    ("---\nDESCRIPTION: orphan\n---\nTITLE: A\nDESCRIPTION: d\n", "missing_title", ["A"]),
+    ("TITLE: A\nHINTS: h\n", "missing_description", ["A"]),
+])
+def test_diagnostics(text, code, titles):
+    problems, diagnostics = parse(text)
+    assert [problem['title'] for problem in problems] == titles
+    assert codes(diagnostics) == [code]
+
+
+def test_duplicate_field_appends():
+    problems, _ = parse("TITLE: A\nDESCRIPTION: one\nDESCRIPTION: two\n")
+    assert problems[0]['description'] == "one\ntwo"
+
+
+def test_diagnostic_line_numbers():
+    _, diagnostics = parse("intro\n---\nDESCRIPTION: orphan\n---\n")
+    assert [(d['code'], d['line']) for d in diagnostics] == [("stray_text", 1), ("missing_title", 3)]
+
+
+# Chunking invariance: any split of the stream parses exactly like a single feed()
+def random_chunks(rng, text):
+    chunks, i = [], 0
+    while i < len(text):
+        j = i + rng.randint(1, 32)
+        chunks.append(text[i:j])
+        i = j
+    return chunks
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunking_invariance(seed):
+    rng = random.Random(seed)
+    for _ in range(25):
+        text = make_response(rng, rng.randint(0, 8), noise=rng.randint(0, 3))
+        expected = parse(text)
+        assert parse(text, random_chunks(rng, text)) == expected, text
+        assert parse(text, list(text)) == expected, text